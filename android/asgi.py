@@ -2,6 +2,8 @@
 ASGI config for android project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django (including the async views under ``async/``),
+websocket connections are routed by Channels.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -13,4 +15,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'android.settings')
 
-application = get_asgi_application()
+# 需要在导入 consumer 等依赖模型的模块之前初始化 Django
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+
+import shoppingmall.routing  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': URLRouter(
+        shoppingmall.routing.websocket_urlpatterns
+    ),
+})
@@ -2,8 +2,8 @@ import os
 
 from celery import Celery
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'android.settings')
 
-app = Celery('project')
+app = Celery('android')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
@@ -15,6 +15,8 @@ from pathlib import Path
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 from django.template.context_processors import media
 
+from android.database import parse_database_url
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
@@ -40,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles', # required for serving swagger ui's css/js files
 
 
+    'channels',
     'rest_framework',
     'rest_framework_swagger',
     'drf_yasg',
@@ -55,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'shoppingmall.middleware.QueryProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'android.urls'
@@ -76,17 +80,31 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'android.wsgi.application'
+ASGI_APPLICATION = 'android.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# DATABASE_URL 未设置时使用本地 SQLite（WAL 模式，见 shoppingmall.signals）；
+# DATABASE_REPLICA_URLS 为逗号分隔的只读副本连接串，只读接口的查询由 ReplicaRouter 发往副本
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///%s' % (BASE_DIR / 'db.sqlite3'))
+DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+# 持久连接的最长复用时间（秒），0 表示每个请求结束后关闭连接
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': parse_database_url(DATABASE_URL, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=True),
 }
+for index, url in enumerate(DATABASE_REPLICA_URLS):
+    DATABASES['replica%d' % index] = dict(parse_database_url(url, conn_max_age=DB_CONN_MAX_AGE,
+                                                             conn_health_checks=True),
+                                          TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['shoppingmall.routers.ReplicaRouter']
+
+# SQLite 等待写锁的时间（秒），WAL 模式下读写互不阻塞，只有写与写之间需要等待
+SQLITE_BUSY_TIMEOUT = 5
 
 
 # Password validation
@@ -113,9 +131,9 @@ REST_FRAMEWORK = {
     #     'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly',
     #     'rest_framework.permissions.IsAdminUser'
     # ],
+    # 接口用户是 shoppingmall.Users 而不是 django.contrib.auth 的用户，只使用登录令牌认证
     'DEFAULT_AUTHENTICATION_CLASSES': (
-      'rest_framework.authentication.TokenAuthentication',
-      'rest_framework.authentication.SessionAuthentication',
+      'shoppingmall.authentication.UserTokenAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
     'PAGE_SIZE': 10,
@@ -159,6 +177,24 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CELERY_BROKER_URL = os.environ['REDIS_URL']
 CELERY_RESULT_BACKEND = os.environ['REDIS_URL']
+CELERY_BEAT_SCHEDULE = {
+    'flush-counters': {
+        'task': 'shoppingmall.tasks.flush_counters',
+        'schedule': 5.0,
+    },
+    'flush-carts': {
+        'task': 'shoppingmall.tasks.flush_carts',
+        'schedule': 5.0,
+    },
+    'rebuild-recommend-feed': {
+        'task': 'shoppingmall.tasks.rebuild_recommend_feed',
+        'schedule': 60.0,
+    },
+    'discard-expired-uploads': {
+        'task': 'shoppingmall.tasks.discard_expired_uploads',
+        'schedule': 60 * 60.0,
+    },
+}
 
 CHANNEL_LAYERS = {
     'default': {
@@ -180,3 +216,65 @@ CACHES = {
 }
 
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
+
+# 订阅时间线：粉丝数超过该值的用户发帖不写扩散，由粉丝读取时拉取
+TIMELINE_FANOUT_LIMIT = 1000
+# 关注或拉取时最多回填的帖子数
+TIMELINE_BACKFILL_SIZE = 50
+
+# 请求性能采样比例（0~1），为 0 时采样中间件不加载
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+# 每个接口保留的最近采样数
+PROFILING_WINDOW = 500
+# 各进程向缓存发布报告的间隔（秒）
+PROFILING_PUBLISH_INTERVAL = 30
+
+# 为 True 时点赞数、评论数等计数先在 Redis 中累加，由 flush_counters 定时写回
+COUNTER_BUFFERED = os.environ.get('COUNTER_BUFFERED') == '1'
+
+# 商品详情缓存时间（秒），销量等计数在该时间内可能不是最新值
+PRODUCE_DETAIL_CACHE_TIMEOUT = 300
+
+# 为 True 时上传图片的缩略图由 Celery 生成，否则在请求进程中提交事务后同步生成
+DERIVATIVES_ASYNC = True
+
+# 发帖图片校验与解码使用的线程数
+POST_UPLOAD_WORKERS = 4
+
+# 两段式发帖 upload_token 的有效期（秒）
+POST_UPLOAD_TOKEN_MAX_AGE = 60 * 60
+
+# 媒体文件发送方式：django 使用 FileResponse；x-accel-redirect / x-sendfile 交给 Nginx / Apache 发送
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+# x-accel-redirect 模式下对应 Nginx 中 internal location 的前缀
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# 非内容哈希命名的媒体文件的浏览器缓存时间（秒）
+MEDIA_CACHE_MAX_AGE = 3600
+
+# 登录令牌有效期（秒）
+AUTH_TOKEN_MAX_AGE = 7 * 24 * 60 * 60
+
+# 推荐流保留的帖子数，以及参与排名的帖子发布时间范围（天）
+RECOMMEND_FEED_SIZE = 1000
+RECOMMEND_WINDOW_DAYS = 30
+
+# 聊天 WebSocket 每个连接每秒允许的消息数与突发上限
+CHAT_RATE_LIMIT = 5
+CHAT_RATE_BURST = 10
+# 聊天 WebSocket 单条消息的最大长度（字符），超过时直接拒绝，不解析 JSON
+CHAT_MAX_MESSAGE_LENGTH = 1000
+# 聊天命令交给 Celery 前的合并等待时间（秒）
+CHAT_DISPATCH_DELAY = 0.01
+
+# 网站状态探测：状态码缓存时间、无法访问或 5xx 结果的缓存时间（秒）、单个请求超时与并发连接数
+PROBE_CACHE_TIMEOUT = 60 * 60
+PROBE_NEGATIVE_TIMEOUT = 5 * 60
+PROBE_TIMEOUT = 10
+PROBE_CONCURRENCY = 20
+
+# 实时事件推送前在连接内合并的时间（秒），期间同一订单、同一帖子的事件合并为一条
+EVENTS_DEBOUNCE = 1.0
+
+# 购物车在 Redis 中的闲置过期时间（秒）与每个用户最多的子商品种类数
+CART_TIMEOUT = 7 * 24 * 60 * 60
+CART_MAX_ITEMS = 100
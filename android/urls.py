@@ -16,7 +16,6 @@ Including another URLconf
 from django.conf.urls import url
 from django.contrib import admin
 from django.urls import path, include
-from django.views.static import serve
 from rest_framework.documentation import include_docs_urls
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
@@ -26,6 +25,7 @@ from drf_yasg import openapi
 # router = routers.DefaultRouter()
 # router.register(r'users', views.UsersViewSet)
 from android import settings
+from shoppingmall import media
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -45,7 +45,7 @@ urlpatterns = [
     # path('shoppingmall/', include('shoppingmall.urls')),
     path('admin/', admin.site.urls),
     path('docs/', include_docs_urls(title='API文档')),
-    url(r'^media/(?P<path>.*)/$', serve, {"document_root": settings.MEDIA_ROOT}),
+    url(r'^media/(?P<path>.+)$', media.serve),
     path('', include('shoppingmall.urls')),
     url(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     url(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
@@ -0,0 +1,53 @@
+"""
+收货地址：每个用户最多一个默认地址，由部分唯一约束 unique_default_address 保证，
+设置默认地址时在同一事务中锁住用户行，再取消原来的默认地址。
+默认地址对象缓存在 default-address:<用户 id> 中，下单与结算不传 address_id 时不再查询；
+地址保存或删除时由 signals 清除缓存。
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Address, Users
+from .routers import read_from_primary
+
+DEFAULT_TIMEOUT = 24 * 60 * 60
+# 缓存“没有默认地址”，与缓存未命中的 None 区分
+NO_DEFAULT = 0
+
+
+def _default_key(user_id):
+    return 'default-address:%s' % user_id
+
+
+def default_address(user_id):
+    """用户的默认地址，没有时返回 None"""
+    key = _default_key(user_id)
+    address = cache.get(key)
+    if address is None:
+        # 缓存的数据从主库读取，避免副本延迟把已取消的默认地址缓存下来
+        with read_from_primary():
+            address = Address.objects.filter(user=user_id, is_default=True).first()
+        cache.set(key, address or NO_DEFAULT, DEFAULT_TIMEOUT)
+    return address or None
+
+
+def forget_default(user_id):
+    """事务提交后再清除一次，避免提交前其他请求把旧的默认地址重新写入缓存"""
+    key = _default_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def save(address, make_default=False):
+    """保存地址；make_default 为 True 时设为默认地址，用户还没有默认地址时新地址也设为默认"""
+    with transaction.atomic():
+        # 锁住用户行，同一用户并发的设置默认地址与新增首个地址依次执行，不会同时通过下面的检查
+        list(Users.objects.select_for_update().filter(pk=address.user_id).values_list('pk', flat=True))
+        if address.pk is None and not make_default:
+            make_default = not Address.objects.filter(user=address.user_id, is_default=True).exists()
+        if make_default:
+            others = Address.objects.filter(user=address.user_id, is_default=True).exclude(pk=address.pk)
+            others.update(is_default=False)
+            address.is_default = True
+        address.save()
+    return address
@@ -0,0 +1,88 @@
+"""
+读多写少接口的异步版本，挂载在 async/ 下，由 ASGI 服务（android.asgi）提供，查询集与同步视图共用。
+Django 3.2 的 ORM 与缓存还没有异步接口，查询和序列化放到线程池执行（thread_sensitive=False），
+事件循环只负责网络读写，单个进程可以同时保持大量慢速连接。
+"""
+import functools
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+
+from . import caching, profiling, ranking
+from .routers import read_from_replica
+from .serializers import BaseProduceDetailSerializer, MallBaseProduceListSerializer, PostDetailSerializer, \
+    PostListSerializer
+from .views import BaseProduceDetailViewSet, CommunityListView, MallProduceListView, PostViewSet
+
+
+def run_in_pool(func):
+    """在线程池中执行同步的数据库访问，并在前后关闭过期的数据库连接；这些接口都是只读的，查询发往只读副本"""
+    @functools.wraps(func)
+    def on_replica(*args, **kwargs):
+        # 线程池中的连接也记录正在采样的请求的查询
+        profiling.install()
+        with read_from_replica():
+            return func(*args, **kwargs)
+    return database_sync_to_async(on_replica, thread_sensitive=False)
+
+
+def _paginate(request, queryset, serializer_class):
+    drf_request = Request(request)
+    paginator = PageNumberPagination()
+    page = paginator.paginate_queryset(queryset, drf_request)
+    data = serializer_class(page, many=True, context={'request': drf_request}).data
+    return paginator.get_paginated_response(data).data
+
+
+def _get_or_404(queryset, pk):
+    try:
+        return queryset.get(pk=pk)
+    except (queryset.model.DoesNotExist, ValueError):
+        raise Http404
+
+
+@run_in_pool
+def _mall_produce_page(request):
+    return _paginate(request, MallProduceListView.queryset.all(), MallBaseProduceListSerializer)
+
+
+@run_in_pool
+def _recommend_page(request):
+    return _paginate(request, ranking.ranked_feed(CommunityListView.queryset.all()), PostListSerializer)
+
+
+@run_in_pool
+def _produce_detail(request, pk):
+    def build():
+        produce = _get_or_404(BaseProduceDetailViewSet.queryset.all(), pk)
+        return BaseProduceDetailSerializer(produce, context={'request': Request(request)}).data
+    return caching.read_through('produce-detail', pk, build, timeout=settings.PRODUCE_DETAIL_CACHE_TIMEOUT)
+
+
+@run_in_pool
+def _post_detail(request, pk):
+    post = _get_or_404(PostViewSet.queryset.all(), pk)
+    return PostDetailSerializer(post, context={'request': Request(request)}).data
+
+
+def _json(data):
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+
+
+async def mall_produce_list(request):
+    return _json(await _mall_produce_page(request))
+
+
+async def community_recommend(request):
+    return _json(await _recommend_page(request))
+
+
+async def produce_detail(request, pk):
+    return _json(await _produce_detail(request, pk))
+
+
+async def post_detail(request, pk):
+    return _json(await _post_detail(request, pk))
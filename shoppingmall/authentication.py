@@ -0,0 +1,80 @@
+"""
+登录令牌认证：登录成功后签发 django.core.signing 签名的令牌，令牌中带有用户 id。
+缓存中保存 令牌 -> 用户 id（登出或过期即失效）以及 用户 id -> 用户对象，
+校验签名不需要访问数据库，两个缓存键通过一次 get_many 读取，每个请求只有一次缓存访问。
+"""
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import Users
+
+TOKEN_SALT = 'shoppingmall.authentication'
+TOKEN_MAX_AGE = getattr(settings, 'AUTH_TOKEN_MAX_AGE', 7 * 24 * 60 * 60)
+USER_CACHE_TIMEOUT = 60 * 60
+
+
+def _token_key(token):
+    return 'auth:token:%s' % hashlib.sha256(token.encode()).hexdigest()
+
+
+def _user_key(user_id):
+    return 'auth:user:%s' % user_id
+
+
+def issue_token(user):
+    token = signing.dumps({'id': user.pk, 'nonce': secrets.token_hex(8)}, salt=TOKEN_SALT)
+    cache.set_many({_token_key(token): user.pk, _user_key(user.pk): user}, TOKEN_MAX_AGE)
+    return token
+
+
+def revoke_token(token):
+    cache.delete(_token_key(token))
+
+
+def forget_user(user_id):
+    """用户信息变化后删除缓存的用户对象，下次请求重新查询"""
+    cache.delete(_user_key(user_id))
+
+
+def resolve_token(token):
+    """返回令牌对应的用户，签名错误、过期、已登出或用户不存在时返回 None"""
+    try:
+        user_id = signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)['id']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+    token_key, user_key = _token_key(token), _user_key(user_id)
+    cached = cache.get_many([token_key, user_key])
+    if cached.get(token_key) != user_id:
+        return None
+    user = cached.get(user_key)
+    if user is None:
+        user = Users.objects.filter(pk=user_id).first()
+        if user is not None:
+            cache.set(user_key, user, USER_CACHE_TIMEOUT)
+    return user
+
+
+class UserTokenAuthentication(BaseAuthentication):
+    """请求头 Authorization: Token <令牌>"""
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('令牌格式错误')
+        token = auth[1].decode(errors='ignore')
+        user = resolve_token(token)
+        if user is None:
+            raise AuthenticationFailed('令牌无效或已过期')
+        return user, token
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,82 @@
+"""
+带版本号的读穿缓存：写操作通过 invalidate（bump_version）使旧数据失效，
+缓存未命中时只允许一个进程重建（single-flight），其余请求返回上一版本数据或短暂等待。
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import read_from_primary
+
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 2
+WAIT_INTERVAL = 0.05
+STALE_TIMEOUT = 24 * 60 * 60
+
+
+def _version_key(namespace, pk):
+    return '%s:%s:version' % (namespace, pk)
+
+
+def _initial_version():
+    # 版本号丢失后从当前时间重新开始，避免与被淘汰前的旧版本号重复
+    return int(time.time() * 1000)
+
+
+def get_version(namespace, pk):
+    key = _version_key(namespace, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, pk):
+    """使 namespace 下主键为 pk 的缓存失效"""
+    key = _version_key(namespace, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+
+def invalidate(namespace, pk):
+    """写操作后调用：立即更新版本号，事务提交后再更新一次。
+    提交前其他请求仍读到旧数据，可能以新版本号写入缓存，提交后的这次更新使其失效"""
+    bump_version(namespace, pk)
+    transaction.on_commit(lambda: bump_version(namespace, pk))
+
+
+def read_through(namespace, pk, builder, timeout=300):
+    """读取缓存，未命中时调用 builder 生成数据并写入缓存"""
+    key = '%s:%s:%s' % (namespace, pk, get_version(namespace, pk))
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    stale_key = '%s:%s:stale' % (namespace, pk)
+    lock_key = key + ':lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            # 写入缓存的数据从主库读取，避免副本延迟把旧数据缓存到下一次失效
+            with read_from_primary():
+                value = builder()
+            cache.set(key, value, timeout)
+            cache.set(stale_key, value, STALE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    # 其他进程正在重建：优先返回上一版本，没有时等待重建完成
+    value = cache.get(stale_key)
+    if value is not None:
+        return value
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return builder()
@@ -0,0 +1,245 @@
+"""
+购物车：活跃用户的购物车保存在 Redis 哈希 cart:<用户 id>（子商品 id -> 数量）中，cart:<用户 id>:added 记录加入时间用于排序。
+首次访问时从 CartItem 载入，闲置 CART_TIMEOUT 后从 Redis 过期。修改在 WATCH/MULTI 事务中只写入有变化的子商品，
+并把用户记入待写回集合，由 Celery 定时任务 flush_carts 合并写回 CartItem；结算前先写回该用户的购物车。
+读取时用一次查询取出全部子商品的名称、价格与封面。
+缓存后端不是 Redis 时（例如测试中的进程内缓存）购物车保存在 Django 缓存中，写入后立即写回数据库。
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .models import CartItem, Produce
+from .routers import read_from_primary
+
+CART_TIMEOUT = getattr(settings, 'CART_TIMEOUT', 7 * 24 * 60 * 60)
+MAX_ITEMS = getattr(settings, 'CART_MAX_ITEMS', 100)
+MAX_QUANTITY = 99
+DIRTY_KEY = 'carts:dirty'
+FLUSH_BATCH_SIZE = 500
+# 哈希中的占位字段，区分“空购物车”与“尚未载入”
+LOADED = '_'
+# 退化实现中修改购物车的锁
+LOCK_TIMEOUT = 5
+LOCK_INTERVAL = 0.01
+
+
+class CartError(Exception):
+    pass
+
+
+def _from_database(user_id):
+    """{子商品 id: (数量, 加入顺序)}，以条目 id 作为加入顺序"""
+    with read_from_primary():
+        rows = CartItem.objects.filter(user=user_id).values_list('id', 'produce_id', 'quantity')
+        return {produce_id: (quantity, item_id) for item_id, produce_id, quantity in rows}
+
+
+class RedisCartStore:
+    """修改在 WATCH/MULTI 事务中完成：读取后购物车被其他请求修改时重新读取并计算，并发的加入与移除不会互相覆盖"""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def _keys(self, user_id):
+        return 'cart:%s' % user_id, 'cart:%s:added' % user_id
+
+    def _decode(self, quantities, added):
+        return {int(produce_id): (int(quantity), float(added.get(produce_id, 0)))
+                for produce_id, quantity in quantities.items() if produce_id != LOADED.encode()}
+
+    def get(self, user_id):
+        quantities_key, added_key = self._keys(user_id)
+        pipeline = self.redis.pipeline()
+        pipeline.hgetall(quantities_key)
+        pipeline.hgetall(added_key)
+        quantities, added = pipeline.execute()
+        if quantities:
+            return self._decode(quantities, added)
+        return self.modify(user_id, dict)
+
+    def modify(self, user_id, change):
+        """change 接收当前购物车并返回修改后的购物车，只写入有变化的子商品"""
+        quantities_key, added_key = self._keys(user_id)
+
+        def apply(pipeline):
+            quantities = pipeline.hgetall(quantities_key)
+            if quantities:
+                cart = self._decode(quantities, pipeline.hgetall(added_key))
+            else:
+                cart = _from_database(user_id)
+            updated = change(cart)
+            changed = {produce_id: line for produce_id, line in updated.items() if cart.get(produce_id) != line}
+            removed = [produce_id for produce_id in cart if produce_id not in updated]
+            # 尚未载入时写入完整的购物车
+            written = changed if quantities else updated
+
+            pipeline.multi()
+            pipeline.hset(quantities_key, mapping=dict({LOADED: 0}, **{str(k): v[0] for k, v in written.items()}))
+            if written:
+                pipeline.hset(added_key, mapping={str(k): v[1] for k, v in written.items()})
+            if removed:
+                pipeline.hdel(quantities_key, *removed)
+                pipeline.hdel(added_key, *removed)
+            pipeline.expire(quantities_key, CART_TIMEOUT)
+            pipeline.expire(added_key, CART_TIMEOUT)
+            if changed or removed:
+                pipeline.sadd(DIRTY_KEY, user_id)
+            return updated
+
+        return self.redis.transaction(apply, quantities_key, added_key, value_from_callable=True)
+
+    def claim(self, user_id):
+        """从待写回集合中取出该用户，返回是否有未写回的修改"""
+        return bool(self.redis.srem(DIRTY_KEY, user_id))
+
+    def pop_dirty(self):
+        return [int(user_id) for user_id in self.redis.spop(DIRTY_KEY, FLUSH_BATCH_SIZE) or []]
+
+    def mark_dirty(self, user_ids):
+        if user_ids:
+            self.redis.sadd(DIRTY_KEY, *user_ids)
+
+
+class CacheCartStore:
+    """没有 Redis 时的退化实现：整个购物车作为一个缓存值，修改时用 cache.add 加锁，写入后同步写回数据库"""
+
+    def _key(self, user_id):
+        return 'cart:%s' % user_id
+
+    def get(self, user_id):
+        cart = cache.get(self._key(user_id))
+        if cart is None:
+            cart = _from_database(user_id)
+            cache.set(self._key(user_id), cart, CART_TIMEOUT)
+        return cart
+
+    def modify(self, user_id, change):
+        lock_key = self._key(user_id) + ':lock'
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise CartError('购物车正在被修改，请稍后重试')
+            time.sleep(LOCK_INTERVAL)
+        try:
+            cart = self.get(user_id)
+            updated = change(cart)
+            if updated != cart:
+                cache.set(self._key(user_id), updated, CART_TIMEOUT)
+                write_back(user_id, updated)
+            return updated
+        finally:
+            cache.delete(lock_key)
+
+    def claim(self, user_id):
+        return False
+
+    def pop_dirty(self):
+        return []
+
+    def mark_dirty(self, user_ids):
+        pass
+
+
+def store():
+    try:
+        return RedisCartStore(get_redis_connection('default'))
+    except NotImplementedError:
+        return CacheCartStore()
+
+
+def hydrate(cart):
+    """[(子商品, 数量)]，最近加入的排在前面；一次查询取出全部子商品，已删除的子商品跳过"""
+    produces = Produce.objects.with_surface().in_bulk(list(cart))
+    ordered = sorted(cart.items(), key=lambda item: item[1][1], reverse=True)
+    return [(produces[produce_id], quantity) for produce_id, (quantity, _) in ordered if produce_id in produces]
+
+
+def items(user_id):
+    """用户购物车的 CartItem 列表（未保存到数据库，只用于序列化）"""
+    return [CartItem(user_id=user_id, produce=produce, quantity=quantity)
+            for produce, quantity in hydrate(store().get(user_id))]
+
+
+def update(user_id, lines, merge=True):
+    """lines 为 [(子商品 id, 数量)]；merge 为 True 时累加数量，否则设置数量，数量不大于 0 时移除"""
+    hydrated = []
+
+    def change(cart):
+        cart = dict(cart)
+        now = time.time()
+        for i, (produce_id, quantity) in enumerate(lines):
+            # 同一次加入的多种子商品按传入顺序排列，后传入的视为较新
+            current, added = cart.get(produce_id, (0, now + i / 1000000))
+            quantity = min(current + quantity if merge else quantity, MAX_QUANTITY)
+            if quantity > 0:
+                cart[produce_id] = (quantity, added)
+            else:
+                cart.pop(produce_id, None)
+
+        # 读取后购物车被修改时 change 会重新执行，只保留最后一次的结果
+        hydrated[:] = hydrate(cart)
+        known = {produce.id for produce, _ in hydrated}
+        unknown = sorted({produce_id for produce_id, _ in lines if produce_id in cart} - known)
+        if unknown:
+            raise CartError('子商品不存在：%s' % ', '.join(map(str, unknown)))
+        if len(cart) > MAX_ITEMS:
+            raise CartError('购物车最多 %d 种商品' % MAX_ITEMS)
+        return cart
+
+    store().modify(user_id, change)
+    return [CartItem(user_id=user_id, produce=produce, quantity=quantity) for produce, quantity in hydrated]
+
+
+def discard(user_id, produce_ids):
+    """结算后从购物车移除已下单的子商品，数据库中的条目已由结算删除"""
+    produce_ids = set(produce_ids)
+    store().modify(user_id, lambda cart: {k: v for k, v in cart.items() if k not in produce_ids})
+
+
+def write_back(user_id, cart):
+    """使 CartItem 与购物车一致：删除多余条目、更新数量、补充新条目"""
+    with transaction.atomic():
+        rows = dict(CartItem.objects.filter(user=user_id).values_list('produce_id', 'quantity'))
+        stale = [produce_id for produce_id in rows if produce_id not in cart]
+        if stale:
+            CartItem.objects.filter(user=user_id, produce_id__in=stale).delete()
+        for produce_id, quantity in rows.items():
+            if produce_id in cart and quantity != cart[produce_id][0]:
+                CartItem.objects.filter(user=user_id, produce_id=produce_id).update(quantity=cart[produce_id][0])
+        missing = [produce_id for produce_id in cart if produce_id not in rows]
+        existing = set(Produce.objects.filter(pk__in=missing).values_list('id', flat=True)) if missing else ()
+        CartItem.objects.bulk_create([CartItem(user_id=user_id, produce_id=produce_id, quantity=cart[produce_id][0])
+                                      for produce_id in missing if produce_id in existing])
+
+
+def write_back_user(user_id):
+    """结算前调用：该用户有未写回的修改时立即写回，并移出待写回集合，避免结算后定时任务再写回已下单的条目"""
+    cart_store = store()
+    if cart_store.claim(user_id):
+        try:
+            write_back(user_id, cart_store.get(user_id))
+        except Exception:
+            cart_store.mark_dirty([user_id])
+            raise
+
+
+def flush():
+    """写回所有有修改的购物车，返回写回的用户数"""
+    cart_store = store()
+    flushed = 0
+    while True:
+        user_ids = cart_store.pop_dirty()
+        if not user_ids:
+            return flushed
+        for i, user_id in enumerate(user_ids):
+            try:
+                write_back(user_id, cart_store.get(user_id))
+            except Exception:
+                # 失败的用户放回待写回集合，下次定时任务重试
+                cart_store.mark_dirty(user_ids[i:])
+                raise
+        flushed += len(user_ids)
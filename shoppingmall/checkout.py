@@ -0,0 +1,64 @@
+"""
+购物车结算：在一个事务中把购物车条目转换为订单。
+库存通过带条件的 UPDATE 原子扣减（stock >= 数量时才扣减），不加行锁，库存不足时整个事务回滚。
+bulk_create 不触发 signals，销量计数在这里按商品合并后直接更新。
+购物车保存在 carts 中，结算前先写回该用户未写回的修改，提交后再从购物车移除已下单的子商品。
+"""
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Prefetch
+
+from . import carts, counters
+from .models import BaseProduce, CartItem, Order, Produce
+
+
+def reserve_stock(produce_id, quantity):
+    """库存充足时扣减并返回 True；并发下由数据库保证不会扣成负数"""
+    return bool(Produce.objects.filter(pk=produce_id, stock__gte=quantity).update(stock=F('stock') - quantity))
+
+
+def checkout(user, address, item_ids=None):
+    """结算用户购物车（或其中指定的条目），返回创建的订单"""
+    if address.user_id != user.id:
+        raise ValidationError('地址不属于该用户')
+
+    carts.write_back_user(user.id)
+    with transaction.atomic():
+        items = CartItem.objects.filter(user=user).select_related('produce')
+        if item_ids is not None:
+            items = items.filter(pk__in=item_ids)
+        items = list(items)
+        if not items:
+            raise ValidationError('购物车为空')
+
+        # 同一子商品的多个购物车条目合并为一个订单
+        quantities = Counter()
+        produces = {}
+        for item in items:
+            quantities[item.produce_id] += item.quantity
+            produces[item.produce_id] = item.produce
+
+        sold_out = [produce_id for produce_id, quantity in quantities.items()
+                    if produces[produce_id].stock is not None and not reserve_stock(produce_id, quantity)]
+        if sold_out:
+            raise ValidationError(['商品 %d 库存不足' % produce_id for produce_id in sold_out])
+
+        orders = Order.objects.bulk_create([Order(user=user, produce_id=produce_id, address=address, quantity=quantity)
+                                            for produce_id, quantity in quantities.items()])
+        CartItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+        transaction.on_commit(lambda: carts.discard(user.id, list(quantities)))
+
+        sales = defaultdict(int)
+        for produce_id, quantity in quantities.items():
+            sales[produces[produce_id].parent_produce_id] += quantity
+        for base_produce_id, quantity in sales.items():
+            counters.incr(BaseProduce, base_produce_id, 'sales_num', quantity)
+
+    # SQLite 的 bulk_create 不回填主键，按 (user, produce, paymentTime) 唯一约束取回订单
+    return list(Order.objects.filter(user=user, produce_id__in=quantities,
+                                     paymentTime__in=[order.paymentTime for order in orders])
+                .select_related('address')
+                .prefetch_related(Prefetch('produce', queryset=Produce.objects.with_surface()))
+                .order_by('id'))
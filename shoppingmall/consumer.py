@@ -1,9 +1,26 @@
+"""
+聊天机器人 WebSocket：AsyncWebsocketConsumer 不为每个连接占用线程，空闲连接只占一个协程。
+命令按连接限流，交给 Celery 的任务在同一事件循环内短时间合并，在线程池中用一个 broker 连接批量发送；
+任务结果通过连接所在的组发回，见 tasks.reply。
+EventConsumer 向登录用户推送订单与帖子事件，见 events.py。
+"""
+import asyncio
 import json
+import logging
+import time
+import uuid
+import weakref
+from urllib.parse import parse_qs
 
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
+from asgiref.sync import sync_to_async
+from celery import current_app
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 
-from . import tasks
+from . import authentication, events, tasks
+
+logger = logging.getLogger(__name__)
 
 COMMANDS = {
     'help': {
@@ -15,44 +32,191 @@ COMMANDS = {
         'task': 'add'
     },
     'status': {
-        'args': 1,
-        'help': 'Check website status. Example: `status twitter.com`.',
+        'args': (1, 10),
+        'help': 'Check status of up to 10 websites. Example: `status twitter.com github.com`.',
         'task': 'url_status'
     },
 }
 
+# 每个连接每秒允许的消息数与突发上限
+RATE_LIMIT = getattr(settings, 'CHAT_RATE_LIMIT', 5)
+RATE_BURST = getattr(settings, 'CHAT_RATE_BURST', 10)
+MAX_MESSAGE_LENGTH = getattr(settings, 'CHAT_MAX_MESSAGE_LENGTH', 1000)
+# 合并发送任务的等待时间（秒）与单批上限
+DISPATCH_DELAY = getattr(settings, 'CHAT_DISPATCH_DELAY', 0.01)
+DISPATCH_BATCH_SIZE = 100
+# 推送事件前的合并等待时间（秒）
+EVENTS_DEBOUNCE = getattr(settings, 'EVENTS_DEBOUNCE', 1.0)
+
+
+class TokenBucket:
+    """令牌桶限流，每秒补充 rate 个令牌，最多积累 burst 个"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def send_batch(signatures):
+    """用同一个 broker 连接发送一批任务"""
+    with current_app.producer_or_acquire() as producer:
+        for signature in signatures:
+            signature.apply_async(producer=producer)
+
+
+class TaskBatcher:
+    """收集同一事件循环中 DISPATCH_DELAY 内提交的任务，合并为一次线程池调用发送"""
+
+    def __init__(self):
+        self.pending = []
+        self.flushing = None
+        self.running = set()
+
+    def submit(self, signature):
+        self.pending.append(signature)
+        if len(self.pending) >= DISPATCH_BATCH_SIZE:
+            self._start(0)
+        elif self.flushing is None:
+            self._start(DISPATCH_DELAY)
+
+    def _start(self, delay):
+        batch, self.pending = self.pending, []
+        self.flushing = asyncio.ensure_future(self._flush(batch, delay))
+        self.running.add(self.flushing)
+        self.flushing.add_done_callback(self.running.discard)
+
+    async def _flush(self, batch, delay):
+        await asyncio.sleep(delay)
+        # 等待期间到达的任务并入本批
+        if self.flushing is asyncio.current_task():
+            batch, self.pending, self.flushing = batch + self.pending, [], None
+        try:
+            await sync_to_async(send_batch, thread_sensitive=False)(batch)
+        except Exception:
+            logger.exception('failed to dispatch %d chat tasks', len(batch))
+
+
+_batchers = weakref.WeakKeyDictionary()
+
+
+def dispatch(signature):
+    """提交任务到当前事件循环的合并发送队列"""
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = TaskBatcher()
+    batcher.submit(signature)
 
-class ChatConsumer(WebsocketConsumer):
-    def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
-
-        response_message = 'Please type `help` for the list of the commands.'
-        message_parts = message.split()
-        if message_parts:
-            command = message_parts[0].lower()
-            if command == 'help':
-                response_message = 'List of the available commands:\n' + '\n'.join(
-                    [f'{command} - {params["help"]} ' for command, params in COMMANDS.items()])
-            elif command in COMMANDS:
-                if len(message_parts[1:]) != COMMANDS[command]['args']:
-                    response_message = f'Wrong arguments for the command `{command}`.'
-                else:
-                    getattr(tasks, COMMANDS[command]['task']).delay(self.channel_name, *message_parts[1:])
-                    response_message = f'Command `{command}` received.'
-
-        async_to_sync(self.channel_layer.send)(
-            self.channel_name,
-            {
-                'type': 'chat_message',
-                'message': response_message
-            }
-        )
-
-    def chat_message(self, event):
-        message = event['message']
-
-        # Send message to WebSocket
-        self.send(text_data=json.dumps({
+
+def parse(message):
+    """解析一条命令，返回 (立即回复的文本, 需要执行的任务名与参数)"""
+    message_parts = message.split()
+    if not message_parts:
+        return 'Please type `help` for the list of the commands.', None
+    command = message_parts[0].lower()
+    if command == 'help':
+        return 'List of the available commands:\n' + '\n'.join(
+            [f'{command} - {params["help"]} ' for command, params in COMMANDS.items()]), None
+    if command not in COMMANDS:
+        return 'Please type `help` for the list of the commands.', None
+    args = COMMANDS[command]['args']
+    least, most = args if isinstance(args, tuple) else (args, args)
+    if not least <= len(message_parts[1:]) <= most:
+        return f'Wrong arguments for the command `{command}`.', None
+    return f'Command `{command}` received.', (COMMANDS[command]['task'], message_parts[1:])
+
+
+class ChatConsumer(AsyncWebsocketConsumer):
+
+    async def connect(self):
+        # Celery worker 把任务结果发到该连接专属的组，由 channel layer 转发到连接所在的进程
+        self.reply_group = 'chat.%s' % uuid.uuid4().hex
+        self.bucket = TokenBucket(RATE_LIMIT, RATE_BURST)
+        await self.channel_layer.group_add(self.reply_group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.reply_group, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if not self.bucket.consume():
+            await self.reply('Too many messages, please slow down.')
+            return
+        if text_data is None:
+            await self.reply('Only text frames are supported.')
+            return
+        if len(text_data) > MAX_MESSAGE_LENGTH:
+            await self.reply('Message is too long.')
+            return
+        try:
+            message = json.loads(text_data)['message']
+        except (ValueError, KeyError, TypeError):
+            await self.reply('Please send JSON like {"message": "help"}.')
+            return
+
+        response_message, command = parse(str(message))
+        if command:
+            task, args = command
+            dispatch(getattr(tasks, task).s(self.reply_group, *args))
+        await self.reply(response_message)
+
+    async def chat_message(self, event):
+        await self.reply(event['message'])
+
+    async def reply(self, message):
+        await self.send(text_data=json.dumps({
             'message': f'[bot]: {message}'
         }))
+
+
+class EventConsumer(AsyncWebsocketConsumer):
+    """登录用户的事件推送，令牌放在请求头 Authorization: Token <令牌> 或查询参数 token 中"""
+
+    async def connect(self):
+        self.group = None
+        user = await database_sync_to_async(authentication.resolve_token)(self.token())
+        if user is None:
+            await self.close()
+            return
+        self.group = events.user_group(user.pk)
+        self.pending = {}
+        self.flushing = None
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    def token(self):
+        for name, value in self.scope.get('headers', []):
+            if name == b'authorization':
+                keyword, _, token = value.decode(errors='ignore').partition(' ')
+                if keyword.lower() == 'token':
+                    return token.strip()
+        return parse_qs(self.scope.get('query_string', b'').decode()).get('token', [''])[0]
+
+    async def disconnect(self, code):
+        if self.group is None:
+            return
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+        if self.flushing is not None:
+            self.flushing.cancel()
+
+    async def user_events(self, message):
+        for event in message['events']:
+            events.merge(self.pending, event)
+        if self.flushing is None:
+            self.flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        await asyncio.sleep(EVENTS_DEBOUNCE)
+        batch, self.pending, self.flushing = list(self.pending.values()), {}, None
+        await self.send(text_data=json.dumps({'events': batch}, ensure_ascii=False))
@@ -0,0 +1,134 @@
+"""
+冗余计数维护：点赞数、评论数、粉丝/关注数、销量。
+默认直接以 F() 表达式原子更新；COUNTER_BUFFERED 为 True 时在事务提交后才在 Redis 哈希中累加，
+由 Celery 定时任务 flush_counters 合并写回，热门帖子的并发点赞只产生一次 UPDATE。
+写回时持有 Redis 锁，多个定时任务不会同时写回；每批增量带有批次号，与 CounterFlush 记录在同一事务中写入，
+写回后、删除 Redis 中的批次前中断时不会重复累加。
+"""
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django_redis import get_redis_connection
+from redis.exceptions import WatchError
+
+PENDING_KEY = 'counters:pending'
+FLUSHING_KEY = 'counters:flushing'
+LOCK_KEY = 'counters:flush-lock'
+# 锁的过期时间要大于一次写回的最长耗时，持锁的 worker 异常退出后锁自动释放
+LOCK_TIMEOUT = 60
+# 批次号保存在写回中的哈希里
+BATCH_FIELD = '_batch'
+
+
+def is_buffered():
+    return getattr(settings, 'COUNTER_BUFFERED', False)
+
+
+def incr(model, pk, field, delta=1):
+    """为 model 主键为 pk 的行的计数字段 field 增加 delta"""
+    incr_many(model, pk, {field: delta})
+
+
+def incr_many(model, pk, deltas):
+    """同一行的多个计数字段一起更新，deltas 为 {字段: 增量}"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas or pk is None:
+        return
+    if is_buffered():
+        # 回滚的事务不应留下增量
+        transaction.on_commit(lambda: _buffer(model, pk, deltas))
+    else:
+        model.objects.filter(pk=pk).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def _buffer(model, pk, deltas):
+    pipeline = get_redis_connection('default').pipeline()
+    for field, delta in deltas.items():
+        pipeline.hincrby(PENDING_KEY, '%s:%s:%s' % (model._meta.label_lower, pk, field), delta)
+    pipeline.execute()
+
+
+def _release(redis, key, token):
+    """只删除自己持有的锁：锁已过期并被其他 worker 取得时令牌不同，不删除"""
+    with redis.pipeline() as pipeline:
+        try:
+            pipeline.watch(key)
+            if pipeline.get(key) == token:
+                pipeline.multi()
+                pipeline.delete(key)
+                pipeline.execute()
+        except WatchError:
+            pass
+
+
+def flush():
+    """将缓冲的增量写回数据库，返回更新的计数个数；其他 worker 正在写回时直接返回 0"""
+    from .models import CounterFlush
+
+    redis = get_redis_connection('default')
+    token = uuid.uuid4().hex.encode()
+    if not redis.set(LOCK_KEY, token, nx=True, ex=LOCK_TIMEOUT):
+        return 0
+    try:
+        # 上一次写回中断时先处理遗留的数据
+        if not redis.exists(FLUSHING_KEY):
+            if not redis.exists(PENDING_KEY):
+                return 0
+            pipeline = redis.pipeline()
+            pipeline.rename(PENDING_KEY, FLUSHING_KEY)
+            pipeline.hset(FLUSHING_KEY, BATCH_FIELD, uuid.uuid4().hex)
+            pipeline.execute()
+        pending = redis.hgetall(FLUSHING_KEY)
+        batch = pending.pop(BATCH_FIELD.encode(), b'').decode()
+
+        with transaction.atomic():
+            _, created = CounterFlush.objects.get_or_create(batch=batch)
+            if created:
+                for key, delta in pending.items():
+                    label, pk, field = key.decode().rsplit(':', 2)
+                    model = apps.get_model(label)
+                    model.objects.filter(pk=pk).update(**{field: F(field) + int(delta)})
+        redis.delete(FLUSHING_KEY)
+        CounterFlush.objects.filter(batch=batch).delete()
+        return len(pending) if created else 0
+    finally:
+        _release(redis, LOCK_KEY, token)
+
+
+def discard_pending():
+    """丢弃尚未写回的增量，全量重建计数之前调用"""
+    get_redis_connection('default').delete(PENDING_KEY, FLUSHING_KEY)
+
+
+def _aggregate(queryset, group_by, aggregate):
+    """按 group_by 分组聚合的相关子查询，无记录时为 0"""
+    subquery = queryset.filter(**{group_by: OuterRef('pk')}).order_by().values(group_by) \
+        .annotate(value=aggregate).values('value')
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+
+def rebuild():
+    """根据明细表全量重建所有计数，每个模型一条 UPDATE 语句"""
+    from .models import BaseProduce, Fans, Order, Post, PostComments, PostLike, ProduceComment, ProduceRating, Users
+
+    if is_buffered():
+        discard_pending()
+    with transaction.atomic():
+        posts = Post.objects.update(like_num=_aggregate(PostLike.objects, 'post', Count('*')),
+                                    comment_num=_aggregate(PostComments.objects, 'post', Count('*')))
+        users = Users.objects.update(fan_num=_aggregate(Fans.objects, 'user', Count('*')),
+                                     subscribe_num=_aggregate(Fans.objects, 'fan', Count('*')))
+        produces = BaseProduce.objects.update(
+            sales_num=_aggregate(Order.objects, 'produce__parent_produce', Sum('quantity')),
+            comment_num=_aggregate(ProduceComment.objects, 'base_produce', Count('*')))
+        stars = {ProduceRating.star_field(star): _aggregate(ProduceComment.objects.filter(star=star),
+                                                            'base_produce', Count('*'))
+                 for star in range(1, 6)}
+        ProduceRating.objects.update(total=_aggregate(ProduceComment.objects, 'base_produce', Count('*')),
+                                     star_sum=_aggregate(ProduceComment.objects, 'base_produce', Sum('star')),
+                                     **stars)
+    return {'posts': posts, 'users': users, 'produces': produces}
@@ -0,0 +1,111 @@
+"""
+上传图片的派生图：原图保存后由 Celery 异步生成 WebP 缩略图，文件名取内容哈希，
+列表接口优先返回缩略图，详情接口的图片同时返回中图 preview。
+派生图写回时通过 save(update_fields=...) 触发原有的 signals（索引刷新、缓存失效）。
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import PostImages, ProduceImages, Users
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_DIR = 'derivatives'
+WEBP_QUALITY = 80
+
+# 模型 -> (原图字段, {派生图字段: 最大宽高})
+DERIVATIVES = {
+    Users: ('icon', {'icon_thumbnail': (128, 128)}),
+    ProduceImages: ('image', {'thumbnail': (320, 320), 'preview': (960, 960)}),
+    PostImages: ('image', {'thumbnail': (320, 320), 'preview': (960, 960)}),
+}
+
+
+def hashed_name(content, extension):
+    """按内容哈希生成文件名，内容不变则文件名不变，可以长期缓存"""
+    digest = hashlib.sha256(content).hexdigest()
+    return '%s/%s/%s.%s' % (DERIVATIVE_DIR, digest[:2], digest, extension)
+
+
+def render_webp(source, size):
+    image = ImageOps.exif_transpose(Image.open(source))
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    image.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def generate(model, pk):
+    """为一条记录生成全部派生图，原图在处理期间被替换时放弃写回"""
+    source_field, sizes = DERIVATIVES[model]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    source = getattr(instance, source_field)
+    if not source:
+        return None
+
+    names = {}
+    try:
+        with source.open('rb') as f:
+            for field, size in sizes.items():
+                f.seek(0)
+                content = render_webp(f, size)
+                name = hashed_name(content, 'webp')
+                if not default_storage.exists(name):
+                    default_storage.save(name, ContentFile(content))
+                names[field] = name
+    except (OSError, ValueError) as e:
+        logger.warning('cannot generate derivatives for %s %s (%s): %s', model.__name__, pk, source.name, e)
+        return None
+
+    with transaction.atomic():
+        current = model.objects.select_for_update().filter(pk=pk).first()
+        if current is None or getattr(current, source_field).name != source.name:
+            return None
+        for field, name in names.items():
+            setattr(current, field, name)
+        current.save(update_fields=list(names))
+    return names
+
+
+def schedule(model, pk):
+    """事务提交后生成派生图，DERIVATIVES_ASYNC 为 False 时在当前进程同步生成"""
+    if getattr(settings, 'DERIVATIVES_ASYNC', True):
+        from . import tasks
+        transaction.on_commit(lambda: tasks.generate_derivatives.delay(model._meta.label_lower, pk))
+    else:
+        transaction.on_commit(lambda: generate(model, pk))
+
+
+def remember_source(sender, instance, **kwargs):
+    instance._derivative_source = getattr(instance, DERIVATIVES[sender][0]).name
+
+
+def reset_derivatives(sender, instance, update_fields=None, **kwargs):
+    """原图被替换时清空旧的派生图，避免列表继续返回旧缩略图"""
+    source_field, sizes = DERIVATIVES[sender]
+    if update_fields is not None and source_field not in update_fields:
+        instance._derivative_pending = False
+        return
+    name = getattr(instance, source_field).name
+    adding = instance._state.adding
+    instance._derivative_pending = bool(name) and (adding or name != getattr(instance, '_derivative_source', None))
+    if instance._derivative_pending and not adding:
+        for field in sizes:
+            setattr(instance, field, '')
+
+
+def source_changed(sender, instance, **kwargs):
+    if getattr(instance, '_derivative_pending', False):
+        instance._derivative_pending = False
+        instance._derivative_source = getattr(instance, DERIVATIVES[sender][0]).name
+        schedule(sender, instance.pk)
@@ -0,0 +1,115 @@
+"""
+实时事件：订单状态变化、帖子被点赞或评论时推送给相关用户，客户端通过 ws/events/ 接收，不再轮询。
+每个用户对应一个 channel layer 组 user.<id>。同一事务内产生的事件在提交后按用户合并为一条组消息发送，
+回滚的 savepoint 中产生的事件不发送，
+EventConsumer 再在 EVENTS_DEBOUNCE 秒内合并同一 key 的事件（计数累加，其余字段取最新值）后写入 WebSocket。
+"""
+import functools
+import logging
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+AUTHOR_TIMEOUT = 24 * 60 * 60
+
+
+def user_group(user_id):
+    return 'user.%s' % user_id
+
+
+def merge(pending, event):
+    """按 key 合并事件，count 累加"""
+    previous = pending.pop(event['key'], None)
+    if previous is not None and 'count' in event:
+        event = dict(event, count=previous.get('count', 0) + event['count'])
+    pending[event['key']] = event
+
+
+def send(events_by_user):
+    """每个用户一条组消息；channel layer 不可用时只记录日志，不影响写请求"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for user_id, events in events_by_user.items():
+        try:
+            async_to_sync(channel_layer.group_send)(user_group(user_id), {'type': 'user.events', 'events': events})
+        except Exception:
+            logger.warning('cannot publish %d events to user %s', len(events), user_id, exc_info=True)
+
+
+class PendingEvents:
+    """一个数据库连接上等待事务提交的事件。
+    每个事件单独通过 transaction.on_commit 登记，所在 savepoint 回滚时 Django 会丢弃它的回调；
+    提交时回调按发布顺序执行，先把事件并入 confirmed，再由同一 savepoint 层级或更外层的最后一个事件统一发送。
+    """
+
+    def __init__(self):
+        self.sequence = 0
+        # [(序号, 发布时的 savepoint id 集合)]
+        self.published = []
+        self.confirmed = defaultdict(dict)
+
+    def add(self, connection, user_id, event):
+        self.sequence += 1
+        sequence, savepoints = self.sequence, frozenset(connection.savepoint_ids)
+        self.published.append((sequence, savepoints))
+        transaction.on_commit(functools.partial(self.deliver, sequence, savepoints, user_id, event))
+
+    def deliver(self, sequence, savepoints, user_id, event):
+        merge(self.confirmed[user_id], event)
+        # 之后发布、所在 savepoint 不比本事件更内层的事件在本事件提交时一定也会提交，由它负责发送
+        if any(later > sequence and later_savepoints <= savepoints for later, later_savepoints in self.published):
+            return
+        self.published = [item for item in self.published if item[0] > sequence]
+        confirmed, self.confirmed = self.confirmed, defaultdict(dict)
+        send({user_id: list(events.values()) for user_id, events in confirmed.items()})
+
+
+def publish(user_id, event):
+    """事务提交后推送事件，事务或事件所在的 savepoint 回滚时丢弃；不在事务中时立即推送"""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        send({user_id: [event]})
+        return
+    pending = getattr(connection, '_pending_events', None)
+    if pending is None:
+        pending = connection._pending_events = PendingEvents()
+    pending.add(connection, user_id, event)
+
+
+def post_author(post_id):
+    """帖子作者 id，作者不会变化，缓存后点赞与评论不再查询帖子"""
+    key = 'post-author:%s' % post_id
+    author_id = cache.get(key)
+    if author_id is None:
+        author_id = Post.objects.filter(pk=post_id).values_list('user_id', flat=True).first()
+        if author_id is not None:
+            cache.set(key, author_id, AUTHOR_TIMEOUT)
+    return author_id
+
+
+def order_status_changed(order):
+    publish(order.user_id, {'type': 'order.status', 'key': 'order:%s' % order.pk,
+                            'order_id': order.pk, 'status': order.status})
+
+
+def post_liked(post_id, user_id, author_id=None):
+    author_id = author_id or post_author(post_id)
+    if author_id is not None and author_id != user_id:
+        publish(author_id, {'type': 'post.liked', 'key': 'post:%s:liked' % post_id,
+                            'post_id': post_id, 'user_id': user_id, 'count': 1})
+
+
+def post_commented(comment, author_id=None):
+    author_id = author_id or post_author(comment.post_id)
+    if author_id is not None and author_id != comment.user_id:
+        publish(author_id, {'type': 'post.commented', 'key': 'post:%s:commented' % comment.post_id,
+                            'post_id': comment.post_id, 'comment_id': comment.pk, 'user_id': comment.user_id,
+                            'content': comment.content[:100], 'count': 1})
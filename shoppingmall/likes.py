@@ -0,0 +1,150 @@
+"""
+帖子点赞：(post, user) 唯一约束保证同一用户对同一帖子只有一条点赞。
+点赞使用 INSERT ... ON CONFLICT DO NOTHING，重复提交与客户端重试不会报错也不会重复计数。
+每个用户点赞过的帖子 id 保存在 Redis 集合 liked-posts:<用户 id> 中，首次读取时从数据库载入，
+之后点赞与取消点赞在提交后用 SADD / SREM 更新集合，帖子列表用 SISMEMBER 一次取出整页的点赞状态。
+缓存后端不是 Redis 时（例如测试中的进程内缓存）集合整体缓存，点赞变化后更新版本号重新查询。
+"""
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from . import caching, counters, events
+from .models import Post, PostLike
+from .routers import read_from_primary
+
+LIKED_NAMESPACE = 'liked-posts'
+LIKED_TIMEOUT = 60 * 60
+# 集合中的占位成员，区分“没有点赞”与“尚未载入”
+LOADED = '_'
+
+
+def _redis():
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        return None
+
+
+def _keys(user_id):
+    """点赞集合与其修改计数，载入集合时监视修改计数，载入期间提交的点赞变化使载入重试"""
+    return '%s:%s' % (LIKED_NAMESPACE, user_id), '%s:%s:changes' % (LIKED_NAMESPACE, user_id)
+
+
+def _insert_sql():
+    qn = connection.ops.quote_name
+    table = qn(PostLike._meta.db_table)
+    columns = ', '.join(qn(column) for column in ('post_id', 'user_id', 'timestamp'))
+    if connection.vendor == 'mysql':
+        return 'INSERT IGNORE INTO %s (%s) VALUES (%%s, %%s, %%s)' % (table, columns)
+    # SQLite 3.24+ 与 PostgreSQL 支持 ON CONFLICT，冲突目标为 unique_post_like 约束的列
+    return 'INSERT INTO %s (%s) VALUES (%%s, %%s, %%s) ON CONFLICT (%s, %s) DO NOTHING' % (
+        table, columns, qn('post_id'), qn('user_id'))
+
+
+def like(user_id, post_id):
+    """点赞，返回是否新增了点赞记录；已点赞时什么也不做"""
+    timestamp = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(_insert_sql(), [post_id, user_id, timestamp])
+        created = cursor.rowcount == 1
+    # 原生 SQL 不触发 signals，计数、缓存与实时事件在这里更新
+    if created:
+        counters.incr(Post, post_id, 'like_num', 1)
+        liked_changed(user_id, post_id, True)
+        events.post_liked(post_id, user_id)
+    return created
+
+
+def unlike(user_id, post_id):
+    """取消点赞，返回是否删除了点赞记录；计数与缓存由 post_delete 信号更新"""
+    deleted, _ = PostLike.objects.filter(post_id=post_id, user_id=user_id).delete()
+    return bool(deleted)
+
+
+def liked_changed(user_id, post_id, liked):
+    """提交后把点赞变化写入该用户的点赞集合"""
+    transaction.on_commit(lambda: _apply_change(user_id, post_id, liked))
+
+
+def _apply_change(user_id, post_id, liked):
+    redis = _redis()
+    if redis is None:
+        caching.bump_version(LIKED_NAMESPACE, user_id)
+        return
+    key, changes_key = _keys(user_id)
+    pipeline = redis.pipeline()
+    # 集合尚未载入时 SADD 只写入部分成员，没有 LOADED 占位，读取时仍会从数据库载入
+    if liked:
+        pipeline.sadd(key, post_id)
+    else:
+        pipeline.srem(key, post_id)
+    pipeline.incr(changes_key)
+    pipeline.expire(key, LIKED_TIMEOUT)
+    pipeline.expire(changes_key, LIKED_TIMEOUT)
+    pipeline.execute()
+
+
+def _load(redis, user_id):
+    key, changes_key = _keys(user_id)
+
+    def load(pipeline):
+        if pipeline.sismember(key, LOADED):
+            return
+        with read_from_primary():
+            ids = list(PostLike.objects.filter(user_id=user_id).values_list('post_id', flat=True))
+        pipeline.multi()
+        pipeline.sadd(key, LOADED, *ids)
+        pipeline.expire(key, LIKED_TIMEOUT)
+
+    redis.transaction(load, key, changes_key)
+
+
+class LikedPosts:
+    """Redis 中的点赞集合：in 使用 SISMEMBER，prefetch 在一次往返中取出一页帖子的点赞状态"""
+
+    def __init__(self, redis, key):
+        self.redis = redis
+        self.key = key
+        self.known = {}
+
+    def prefetch(self, post_ids):
+        post_ids = list(dict.fromkeys(post_id for post_id in post_ids if post_id not in self.known))
+        if not post_ids:
+            return
+        pipeline = self.redis.pipeline(transaction=False)
+        for post_id in post_ids:
+            pipeline.sismember(self.key, post_id)
+        self.known.update(zip(post_ids, map(bool, pipeline.execute())))
+
+    def __contains__(self, post_id):
+        if post_id not in self.known:
+            self.prefetch([post_id])
+        return self.known[post_id]
+
+
+def liked_post_ids(user_id):
+    """用户点赞过的帖子 id，支持 in 判断；集合未载入或已过期时从数据库载入一次"""
+    redis = _redis()
+    if redis is None:
+        return _cached_post_ids(user_id)
+    key, _ = _keys(user_id)
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.sismember(key, LOADED)
+    pipeline.expire(key, LIKED_TIMEOUT)
+    loaded, _ = pipeline.execute()
+    if not loaded:
+        _load(redis, user_id)
+    return LikedPosts(redis, key)
+
+
+def _cached_post_ids(user_id):
+    """没有 Redis 时的退化实现：集合整体缓存，点赞变化后版本号更新，下次读取时重新查询"""
+    key = '%s:%s:%s' % (LIKED_NAMESPACE, user_id, caching.get_version(LIKED_NAMESPACE, user_id))
+    ids = cache.get(key)
+    if ids is None:
+        with read_from_primary():
+            ids = set(PostLike.objects.filter(user_id=user_id).values_list('post_id', flat=True))
+        cache.set(key, ids, LIKED_TIMEOUT)
+    return ids
@@ -0,0 +1,147 @@
+import json
+import re
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from shoppingmall import authentication
+from shoppingmall.routers import read_from_primary
+from shoppingmall.models import BaseProduce, Category, Order, Post, Users
+from shoppingmall.seed import seed_dataset
+
+# SQLite: "SCAN table" 为全表扫描，"SCAN table USING INDEX" 为按索引顺序读取，"SEARCH" 为索引查找
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?P<table>\w+)(?: AS \w+)?$')
+SQLITE_TEMP_SORT = re.compile(r'^USE TEMP B-TREE FOR (?P<what>.+)$')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (?P<table>\w+)')
+# 合成数据在结束时回滚，检查期间的缓存与计数缓冲不能写入共享的 Redis，否则会留下指向已回滚数据的缓存
+AUDIT_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'explain-queries'}},
+    'COUNTER_BUFFERED': False,
+}
+
+
+def endpoints(user, post, produce, order, category):
+    """需要检查的读接口，与 EndpointBudgetTests 覆盖的接口一致"""
+    return [
+        ('users-detail', '/users/%d/' % user.id),
+        ('users-orders', '/users/orders/%d/' % user.id),
+        ('users-myposts', '/users/myposts/%d/' % user.id),
+        ('users-likeposts', '/users/likeposts/%d/' % user.id),
+        ('users-carts', '/users/carts/%d/' % user.id),
+        ('users-address', '/users/address/%d/' % user.id),
+        ('community-subscribe', '/community/subscribe/%d/' % user.id),
+        ('community-recommend', '/community/recommend/'),
+        ('community-posts-detail', '/community/posts/%d/' % post.id),
+        ('posts-detail', '/posts/%d/' % post.id),
+        ('malls', '/malls/'),
+        ('malls-category', '/malls/category/%s/' % category.name),
+        ('malls-produces-detail', '/malls/produces/%d/' % produce.id),
+        ('malls-produces-comments-time', '/malls/produces/%d/comments/?sort=time' % produce.id),
+        ('malls-produces-comments-star', '/malls/produces/%d/comments/?sort=star' % produce.id),
+        ('malls-produces-comments-likes', '/malls/produces/%d/comments/?sort=likes' % produce.id),
+        ('malls-orders-detail', '/malls/orders/%d/' % order.id),
+        ('addresses-list', '/addresses/'),
+        ('carts', '/carts/'),
+        ('search-produces', '/search/produces/?q=%s' % produce.name[:2]),
+        ('search-posts', '/search/posts/?q=%s' % post.title[:2]),
+        ('search-suggest', '/search/suggest/?q=%s' % produce.name[:1]),
+    ]
+
+
+def explain(sql):
+    """返回 (查询计划文本, 全表扫描的表, 临时排序)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            details = [row[-1] for row in cursor.fetchall()]
+            scans = [m.group('table') for m in map(SQLITE_FULL_SCAN.match, details) if m]
+            sorts = [m.group('what') for m in map(SQLITE_TEMP_SORT.match, details) if m]
+        elif connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN ' + sql)
+            details = [row[0] for row in cursor.fetchall()]
+            scans = [m.group('table') for m in map(POSTGRES_FULL_SCAN.search, details) if m]
+            sorts = [line.strip() for line in details if line.strip().startswith('Sort')]
+        else:
+            raise CommandError('EXPLAIN is only supported on SQLite and PostgreSQL')
+    return details, scans, sorts
+
+
+class Command(BaseCommand):
+    help = ('在合成数据上请求各读接口，对每条 SELECT 执行 EXPLAIN QUERY PLAN，列出全表扫描与临时排序。\n'
+            '默认在事务中写入合成数据并在结束后回滚，--no-seed 时直接使用当前数据库')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-seed', action='store_true', help='不写入合成数据，使用数据库中已有的数据')
+        parser.add_argument('--users', type=int, default=200, help='合成数据的用户数')
+        parser.add_argument('--allow', nargs='*', default=['shoppingmall_category'],
+                            help='允许全表扫描的小表')
+        parser.add_argument('--strict', action='store_true', help='发现全表扫描时以非零状态退出')
+        parser.add_argument('--verbose', action='store_true', help='输出每条查询的完整查询计划')
+        parser.add_argument('--json', action='store_true', help='输出 JSON 结果')
+
+    def handle(self, *args, **options):
+        with override_settings(**AUDIT_SETTINGS), transaction.atomic():
+            if options['no_seed']:
+                targets = self.existing_targets()
+            else:
+                data = seed_dataset(users=options['users'], categories=max(1, options['users'] // 20),
+                                    produces_per_category=20)
+                targets = (data['users'][0], data['posts'][0], data['produces'][0], data['orders'][0],
+                           data['categories'][0])
+            results = self.audit(endpoints(*targets), set(options['allow']), targets[0])
+            transaction.set_rollback(True)
+            caches['default'].clear()
+
+        flagged = [result for result in results if result['full_scans']]
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, ensure_ascii=False))
+        else:
+            self.report(results, options['verbose'])
+        if options['strict'] and flagged:
+            raise CommandError('%d endpoints have full table scans' % len(flagged))
+
+    def existing_targets(self):
+        # 订单详情需要登录，取第一个订单的用户作为请求用户
+        order = Order.objects.select_related('user').order_by('id').first()
+        targets = (order and order.user, Post.objects.order_by('id').first(),
+                   BaseProduce.objects.order_by('id').first(), order, Category.objects.order_by('name').first())
+        if None in targets:
+            raise CommandError('database is empty, run without --no-seed')
+        return targets
+
+    def audit(self, paths, allowed, user):
+        token = authentication.issue_token(user)
+        client = Client(HTTP_AUTHORIZATION='Token %s' % token)
+        results = []
+        # 合成数据在未提交的事务中，只读副本看不到；读接口的查询也改用主库，才能被捕获并 EXPLAIN
+        with override_settings(ALLOWED_HOSTS=['testserver']), read_from_primary():
+            for name, path in paths:
+                with CaptureQueriesContext(connection) as ctx:
+                    response = client.get(path)
+                queries = []
+                for query in ctx.captured_queries:
+                    if not query['sql'].lstrip().upper().startswith('SELECT'):
+                        continue
+                    plan, scans, sorts = explain(query['sql'])
+                    queries.append({'sql': query['sql'], 'plan': plan, 'sorts': sorts,
+                                    'full_scans': [table for table in scans if table not in allowed]})
+                results.append({'endpoint': name, 'path': path, 'status': response.status_code,
+                                'queries': queries,
+                                'full_scans': sorted({table for q in queries for table in q['full_scans']})})
+        authentication.revoke_token(token)
+        return results
+
+    def report(self, results, verbose):
+        for result in results:
+            style = self.style.ERROR if result['full_scans'] else self.style.SUCCESS
+            self.stdout.write(style('%-32s %3d  %d queries  %s' % (
+                result['endpoint'], result['status'], len(result['queries']),
+                'full scan: ' + ', '.join(result['full_scans']) if result['full_scans'] else 'ok')))
+            for query in result['queries']:
+                if verbose or query['full_scans'] or query['sorts']:
+                    self.stdout.write('    %s' % query['sql'][:200])
+                    for line in query['plan']:
+                        self.stdout.write('      %s' % line)
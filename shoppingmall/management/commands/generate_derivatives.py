@@ -0,0 +1,28 @@
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from shoppingmall import derivatives, tasks
+
+
+class Command(BaseCommand):
+    help = '为缺少派生图的历史图片补生成缩略图，--async 时投递到 Celery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--async', action='store_true', dest='use_async', help='通过 Celery 任务生成')
+
+    def handle(self, *args, **options):
+        for model, (source_field, sizes) in derivatives.DERIVATIVES.items():
+            missing = reduce(or_, [Q(**{field: ''}) for field in sizes])
+            pks = model.objects.exclude(**{source_field: ''}).filter(missing).values_list('pk', flat=True)
+            generated = 0
+            for pk in pks.iterator():
+                if options['use_async']:
+                    tasks.generate_derivatives.delay(model._meta.label_lower, pk)
+                    generated += 1
+                elif derivatives.generate(model, pk):
+                    generated += 1
+            action = 'queued' if options['use_async'] else 'generated'
+            self.stdout.write('%s: %d %s' % (model.__name__, generated, action))
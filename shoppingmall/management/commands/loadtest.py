@@ -0,0 +1,74 @@
+import asyncio
+import json
+import math
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
+
+
+async def run_target(url, total, concurrency, timeout):
+    """以 concurrency 个并发连接请求 url 共 total 次，返回延迟与错误统计"""
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    result = {'url': url, 'requests': total, 'concurrency': concurrency, 'errors': errors,
+              'seconds': round(elapsed, 2), 'rps': round(total / elapsed, 1)}
+    if latencies:
+        result.update({'p50_ms': round(percentile(latencies, 50), 1),
+                       'p95_ms': round(percentile(latencies, 95), 1),
+                       'p99_ms': round(percentile(latencies, 99), 1)})
+    return result
+
+
+class Command(BaseCommand):
+    help = ('对比多个地址在并发下的吞吐与延迟，例如 WSGI 服务的 /malls/ 与 ASGI 服务的 /async/malls/：\n'
+            'manage.py loadtest http://127.0.0.1:8000/malls/ http://127.0.0.1:8001/async/malls/ -c 200')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+')
+        parser.add_argument('-n', '--requests', type=int, default=2000, help='每个地址的请求总数')
+        parser.add_argument('-c', '--concurrency', type=int, default=100, help='并发连接数')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--json', action='store_true', help='输出 JSON 结果')
+
+    def handle(self, *args, **options):
+        results = []
+        for url in options['urls']:
+            results.append(asyncio.run(run_target(url, options['requests'], options['concurrency'],
+                                                  options['timeout'])))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write('%(url)s\n  %(requests)d requests, concurrency %(concurrency)d, '
+                              '%(errors)d errors, %(rps).1f req/s' % result)
+            if 'p50_ms' in result:
+                self.stdout.write('  p50 %(p50_ms).1fms  p95 %(p95_ms).1fms  p99 %(p99_ms).1fms' % result)
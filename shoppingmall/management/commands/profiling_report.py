@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from shoppingmall import profiling
+
+
+class Command(BaseCommand):
+    help = '输出各进程发布的接口性能采样报告，按 SQL 总耗时排序'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='输出原始 JSON')
+        parser.add_argument('--limit', type=int, default=20, help='每个进程最多输出的接口数')
+
+    def handle(self, *args, **options):
+        reports = profiling.collect_reports()
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2, ensure_ascii=False))
+            return
+        if not reports:
+            self.stdout.write('no profiling reports published (is PROFILING_SAMPLE_RATE > 0?)')
+            return
+
+        for report in reports:
+            self.stdout.write(self.style.MIGRATE_HEADING('worker %s' % report['worker']))
+            endpoints = sorted(report['endpoints'].items(), key=lambda item: item[1]['total_sql_ms'], reverse=True)
+            for endpoint, stats in endpoints[:options['limit']]:
+                self.stdout.write('  %-45s n=%-6d p95=%8.1fms queries=%6.1f sql=%8.1fms' % (
+                    endpoint, stats['requests'], stats['p95_ms'], stats['avg_queries'], stats['avg_sql_ms']))
+                for duplicate in stats['duplicate_queries']:
+                    self.stdout.write('      dup x%-4d %s' % (duplicate['count'], duplicate['sql'][:120]))
+                for field in stats['slowest_fields']:
+                    self.stdout.write('      field %-40s %8.1fms' % (field['field'], field['total_ms']))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shoppingmall.models import CategoryProduceIndex
+
+
+class Command(BaseCommand):
+    help = '全量重建商品分类索引（批量 update() 等绕过 signals 的修改之后使用）'
+
+    def handle(self, *args, **options):
+        count = CategoryProduceIndex.rebuild()
+        self.stdout.write(self.style.SUCCESS('rebuilt %d category index rows' % count))
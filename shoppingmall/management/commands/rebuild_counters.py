@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from shoppingmall import counters
+
+
+class Command(BaseCommand):
+    help = '根据点赞、评论、粉丝、订单明细全量重建冗余计数'
+
+    def handle(self, *args, **options):
+        updated = counters.rebuild()
+        self.stdout.write(self.style.SUCCESS('rebuilt counters for %(posts)d posts, %(users)d users, '
+                                             '%(produces)d produces' % updated))
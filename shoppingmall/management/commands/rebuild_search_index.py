@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shoppingmall import search
+
+
+class Command(BaseCommand):
+    help = '全量重建商品与帖子的全文搜索索引，用于绕过 signals 的批量修改之后'
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild()
+        if not indexed:
+            self.stdout.write(self.style.WARNING('full-text search is not supported on this database'))
+            return
+        self.stdout.write(self.style.SUCCESS('indexed %(produce)d produces, %(post)d posts' % indexed))
@@ -0,0 +1,155 @@
+"""
+媒体文件服务：替代 django.views.static.serve。
+支持强 ETag 与条件请求、单段 Range 请求；内容哈希命名的派生图返回 immutable 长缓存。
+MEDIA_SERVE_MODE 为 x-accel-redirect / x-sendfile 时只返回响应头，由前端 Nginx / Apache 发送文件内容，
+否则使用 FileResponse，完整响应在支持 wsgi.file_wrapper 的服务器上走 sendfile。
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# derivatives.hashed_name 生成的文件名，内容变化时文件名一定变化
+_HASHED_NAME = re.compile(r'^derivatives/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.\w+$')
+_RANGE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+
+def etag_for(path, stat):
+    match = _HASHED_NAME.match(path)
+    if match:
+        return '"%s"' % match.group('digest')
+    return '"%x-%x"' % (stat.st_size, stat.st_mtime_ns)
+
+
+def cache_control_for(path):
+    if _HASHED_NAME.match(path):
+        return 'public, max-age=%d, immutable' % IMMUTABLE_MAX_AGE
+    return 'public, max-age=%d' % getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)
+
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and int(mtime) <= since
+
+
+def parse_range(header, size):
+    """解析单段 Range，返回闭区间 (start, end)；多段或格式不支持时返回 None 表示忽略，无法满足时抛出 ValueError"""
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.group('start'), match.group('end')
+    if not start:
+        if not end:
+            return None
+        length = int(end)
+        if length == 0:
+            raise ValueError
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def iter_range(file, start, end):
+    try:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def offload(path, full_path, mode):
+    """把文件发送交给前端服务器，Range 也由前端服务器处理"""
+    response = HttpResponse()
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(path)
+    else:
+        response['X-Sendfile'] = full_path
+    # 让前端服务器根据文件扩展名设置 Content-Type
+    del response['Content-Type']
+    return response
+
+
+@require_safe
+def serve(request, path, document_root=None):
+    document_root = document_root or settings.MEDIA_ROOT
+    # 越出 document_root 的路径由 safe_join 抛出 SuspiciousFileOperation，返回 400
+    full_path = safe_join(os.path.abspath(document_root), path)
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('"%s" does not exist' % path)
+    if not os.path.isfile(full_path):
+        raise Http404('"%s" does not exist' % path)
+
+    etag = etag_for(path, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control_for(path),
+    }
+    if not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        response = offload(path, full_path, mode)
+    else:
+        response = file_response(request, full_path, stat.st_size, etag)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def file_response(request, full_path, size, etag):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # If-Range 与当前 ETag 不一致说明文件已变化，返回完整内容
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_range(open(full_path, 'rb'), start, end),
+                                         status=206, content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
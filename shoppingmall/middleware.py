@@ -0,0 +1,73 @@
+import asyncio
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import profiling
+
+
+class QueryProfilingMiddleware:
+    """
+    按 PROFILING_SAMPLE_RATE 采样请求，记录查询数、SQL 耗时、重复查询与序列化字段耗时。
+    采样率为 0 时不加载该中间件，可以常驻 MIDDLEWARE。
+    同时支持同步与异步调用，ASGI 下异步视图不会因为该中间件被切换到同步线程执行。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # 与 Django 的 MiddlewareMixin 相同，让处理器把该实例当作协程函数调用
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        profiling.instrument_serializers()
+        profiling.instrument_connections()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profiling.install()
+        profile = profiling.RequestProfile()
+        token = profiling._current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling._current.reset(token)
+        self.record(request, time.perf_counter() - start, profile)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        # 线程池中执行的查询通过复制的上下文找到当前请求
+        profile = profiling.RequestProfile()
+        token = profiling._current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling._current.reset(token)
+        profiling.report.add(self.endpoint(request), time.perf_counter() - start, profile)
+        # 发布报告需要写缓存，不在事件循环中执行
+        await sync_to_async(profiling.report.maybe_publish, thread_sensitive=False)()
+        return response
+
+    def endpoint(self, request):
+        match = getattr(request, 'resolver_match', None)
+        return '%s %s' % (request.method, match.view_name if match else request.path)
+
+    def record(self, request, duration, profile):
+        profiling.report.add(self.endpoint(request), duration, profile)
+        profiling.report.maybe_publish()
@@ -0,0 +1,113 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:12
+
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def build_category_index(apps, schema_editor):
+    BaseProduce = apps.get_model('shoppingmall', 'BaseProduce')
+    ProduceImages = apps.get_model('shoppingmall', 'ProduceImages')
+    CategoryProduceIndex = apps.get_model('shoppingmall', 'CategoryProduceIndex')
+
+    surface = ProduceImages.objects.filter(produce=OuterRef('pk'), order_number=1).values('image')[:1]
+    produces = BaseProduce.objects.filter(is_active=True).annotate(min_price=Min('sub_produce__price'),
+                                                                   surface=Subquery(surface))
+    CategoryProduceIndex.objects.bulk_create([
+        CategoryProduceIndex(base_produce_id=produce.id,
+                             category_id=produce.category_id,
+                             name=produce.name,
+                             min_price=produce.min_price,
+                             surface=produce.surface or "")
+        for produce in produces
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0011_alter_postimages_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producecomment',
+            name='content',
+            field=models.CharField(default='', max_length=500),
+        ),
+        migrations.AlterField(
+            model_name='address',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='address', to='shoppingmall.users'),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='shoppingmall.users'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='produce',
+            field=models.ForeignKey(default='', on_delete=django.db.models.deletion.CASCADE, related_name='produce', to='shoppingmall.produce'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(default='未发货', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='shoppingmall.users'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='posts', to='shoppingmall.users'),
+        ),
+        migrations.AlterField(
+            model_name='postcomments',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='shoppingmall.post'),
+        ),
+        migrations.AlterField(
+            model_name='postimages',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='shoppingmall.post'),
+        ),
+        migrations.AlterField(
+            model_name='postlike',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='love', to='shoppingmall.users'),
+        ),
+        migrations.AlterField(
+            model_name='produce',
+            name='parent_produce',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sub_produce', to='shoppingmall.baseproduce'),
+        ),
+        migrations.AlterField(
+            model_name='producecomment',
+            name='base_produce',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='shoppingmall.baseproduce'),
+        ),
+        migrations.AlterField(
+            model_name='produceimages',
+            name='produce',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='shoppingmall.baseproduce'),
+        ),
+        migrations.CreateModel(
+            name='CategoryProduceIndex',
+            fields=[
+                ('base_produce', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='category_index', serialize=False, to='shoppingmall.baseproduce')),
+                ('name', models.CharField(max_length=200)),
+                ('min_price', models.FloatField(null=True)),
+                ('surface', models.CharField(default='', max_length=100)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='produce_index', to='shoppingmall.category')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='categoryproduceindex',
+            index=models.Index(fields=['category', 'base_produce'], name='shoppingmal_categor_5f14c7_idx'),
+        ),
+        migrations.RunPython(build_category_index, migrations.RunPython.noop),
+    ]
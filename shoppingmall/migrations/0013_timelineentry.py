@@ -0,0 +1,45 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_timeline(apps, schema_editor):
+    Fans = apps.get_model('shoppingmall', 'Fans')
+    Post = apps.get_model('shoppingmall', 'Post')
+    TimelineEntry = apps.get_model('shoppingmall', 'TimelineEntry')
+
+    for fan in Fans.objects.all().iterator():
+        posts = Post.objects.filter(user=fan.user_id).order_by('-timestamp').values_list('id', 'timestamp')[:50]
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(owner_id=fan.fan_id, post_id=post_id, timestamp=timestamp)
+            for post_id, timestamp in posts
+        ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0012_categoryproduceindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='shoppingmall.users')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='shoppingmall.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['owner', 'timestamp'], name='shoppingmal_owner_i_dbe775_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('owner', 'post')},
+        ),
+        migrations.RunPython(backfill_timeline, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:21
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+
+def build_ratings(apps, schema_editor):
+    BaseProduce = apps.get_model('shoppingmall', 'BaseProduce')
+    ProduceRating = apps.get_model('shoppingmall', 'ProduceRating')
+
+    aggregates = {'star_%d' % star: Count('comments', filter=Q(comments__star=star)) for star in range(1, 6)}
+    produces = BaseProduce.objects.annotate(total=Count('comments'), star_sum=Sum('comments__star'), **aggregates)
+    ProduceRating.objects.bulk_create([
+        ProduceRating(base_produce_id=produce.id,
+                      total=produce.total,
+                      star_sum=produce.star_sum or 0,
+                      **{field: getattr(produce, field) for field in aggregates})
+        for produce in produces
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0013_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProduceRating',
+            fields=[
+                ('base_produce', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='shoppingmall.baseproduce')),
+                ('star_1', models.IntegerField(default=0)),
+                ('star_2', models.IntegerField(default=0)),
+                ('star_3', models.IntegerField(default=0)),
+                ('star_4', models.IntegerField(default=0)),
+                ('star_5', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('star_sum', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0014_producerating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='ad_thumbnail',
+            field=models.ImageField(blank=True, default='', upload_to='derivatives'),
+        ),
+        migrations.AddField(
+            model_name='postimages',
+            name='preview',
+            field=models.ImageField(blank=True, default='', upload_to='derivatives'),
+        ),
+        migrations.AddField(
+            model_name='postimages',
+            name='thumbnail',
+            field=models.ImageField(blank=True, default='', upload_to='derivatives'),
+        ),
+        migrations.AddField(
+            model_name='produceimages',
+            name='preview',
+            field=models.ImageField(blank=True, default='', upload_to='derivatives'),
+        ),
+        migrations.AddField(
+            model_name='produceimages',
+            name='thumbnail',
+            field=models.ImageField(blank=True, default='', upload_to='derivatives'),
+        ),
+        migrations.AddField(
+            model_name='users',
+            name='icon_thumbnail',
+            field=models.ImageField(blank=True, default='', upload_to='derivatives'),
+        ),
+    ]
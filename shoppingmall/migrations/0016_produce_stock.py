@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0015_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produce',
+            name='stock',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
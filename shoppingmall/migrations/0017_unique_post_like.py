@@ -0,0 +1,33 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:34
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    """每个 (post, user) 只保留最早的点赞，并按剩余记录重算点赞数"""
+    Post = apps.get_model('shoppingmall', 'Post')
+    PostLike = apps.get_model('shoppingmall', 'PostLike')
+
+    duplicates = PostLike.objects.values('post_id', 'user_id').annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    affected = set()
+    for row in duplicates.iterator():
+        PostLike.objects.filter(post_id=row['post_id'], user_id=row['user_id']).exclude(id=row['keep']).delete()
+        affected.add(row['post_id'])
+    for post_id in affected:
+        Post.objects.filter(id=post_id).update(like_num=PostLike.objects.filter(post_id=post_id).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0016_produce_stock'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='postlike',
+            constraint=models.UniqueConstraint(fields=('post', 'user'), name='unique_post_like'),
+        ),
+    ]
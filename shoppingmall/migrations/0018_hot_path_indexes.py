@@ -0,0 +1,61 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0017_unique_post_like'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(condition=models.Q(('is_default', True)), fields=['user'], name='address_user_default_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='baseproduce',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['id'], name='baseproduce_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='baseproduce',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'id'], name='baseproduce_active_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fans',
+            index=models.Index(fields=['fan', 'user'], name='fans_fan_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-paymentTime'], name='order_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-timestamp'], name='post_active_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-timestamp'], name='post_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['user', '-timestamp'], name='postlike_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produce',
+            index=models.Index(fields=['parent_produce', 'price'], name='produce_parent_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producecomment',
+            index=models.Index(fields=['base_produce', '-commentTime'], name='comment_produce_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producecomment',
+            index=models.Index(fields=['base_produce', '-star', '-commentTime'], name='comment_produce_star_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producecomment',
+            index=models.Index(fields=['base_produce', '-comment_like_num', '-commentTime'], name='comment_produce_likes_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:42
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import migrations, models
+
+
+def hash_plaintext_passwords(apps, schema_editor):
+    """把明文保存的密码替换为哈希，已经是哈希格式的跳过"""
+    Users = apps.get_model('shoppingmall', 'Users')
+    for user in Users.objects.only('id', 'password').iterator():
+        try:
+            identify_hasher(user.password)
+        except ValueError:
+            Users.objects.filter(id=user.id).update(password=make_password(user.password))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0018_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='users',
+            name='password',
+            field=models.CharField(default='123456', max_length=128),
+        ),
+        migrations.RunPython(hash_plaintext_passwords, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:02
+
+import re
+
+from django.db import migrations
+
+# 列含义见 shoppingmall/search.py：kind/object_id 指向商品或帖子，label 为原始标题，其余列保存二元组切分后的文本
+SQLITE_CREATE = ("CREATE VIRTUAL TABLE shoppingmall_search USING fts5("
+                 "kind UNINDEXED, object_id UNINDEXED, label UNINDEXED, title, body, tokenize = 'unicode61')")
+POSTGRES_CREATE = [
+    "CREATE TABLE shoppingmall_search (kind varchar(16) NOT NULL, object_id bigint NOT NULL, "
+    "label text NOT NULL, document tsvector NOT NULL, PRIMARY KEY (kind, object_id))",
+    "CREATE INDEX shoppingmall_search_document_idx ON shoppingmall_search USING GIN (document)",
+]
+INSERT = {
+    'sqlite': 'INSERT INTO shoppingmall_search (kind, object_id, label, title, body) VALUES (%s, %s, %s, %s, %s)',
+    'postgresql': "INSERT INTO shoppingmall_search (kind, object_id, label, document) VALUES "
+                  "(%s, %s, %s, setweight(to_tsvector('simple', %s), 'A') || "
+                  "setweight(to_tsvector('simple', %s), 'B'))",
+}
+
+# 迁移不引用应用代码，切分规则复制自 shoppingmall/search.py 编写本迁移时的版本
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN = re.compile(r'[%s]+|[^\W_%s]+' % (_CJK, _CJK))
+_CJK_RUN = re.compile(r'[%s]' % _CJK)
+
+
+def tokenize(text):
+    tokens = []
+    for run in _TOKEN.findall((text or '').lower()):
+        if not _CJK_RUN.match(run) or len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return ' '.join(tokens)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_CREATE:
+            schema_editor.execute(sql)
+    else:
+        return
+
+    # 写入已有数据，之后由 signals 维护
+    BaseProduce = apps.get_model('shoppingmall', 'BaseProduce')
+    Produce = apps.get_model('shoppingmall', 'Produce')
+    Post = apps.get_model('shoppingmall', 'Post')
+    db = schema_editor.connection.alias
+    children = {}
+    for parent_id, child_name in Produce.objects.using(db).values_list('parent_produce_id', 'child_name').iterator():
+        children.setdefault(parent_id, []).append(child_name)
+    with schema_editor.connection.cursor() as cursor:
+        produces = BaseProduce.objects.using(db).filter(is_active=True).values_list('id', 'name')
+        for produce_id, name in produces.iterator():
+            cursor.execute(INSERT[vendor], ['produce', produce_id, name, tokenize(name),
+                                            tokenize(' '.join(children.get(produce_id, ())))])
+        posts = Post.objects.using(db).filter(is_active=True).values_list('id', 'title', 'content')
+        for post_id, title, content in posts.iterator():
+            cursor.execute(INSERT[vendor], ['post', post_id, title, tokenize(title), tokenize(content)])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS shoppingmall_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0019_hash_user_passwords'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:57
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    """每个 (user, produce) 合并为最早的一条，数量累加"""
+    CartItem = apps.get_model('shoppingmall', 'CartItem')
+
+    duplicates = (CartItem.objects.values('user_id', 'produce_id')
+                  .annotate(n=Count('id'), keep=Min('id'), total=Sum('quantity')).filter(n__gt=1))
+    for row in duplicates.iterator():
+        CartItem.objects.filter(id=row['keep']).update(quantity=row['total'])
+        CartItem.objects.filter(user_id=row['user_id'], produce_id=row['produce_id']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0020_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'produce'), name='unique_cart_item'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:01
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def keep_one_default_address(apps, schema_editor):
+    """有多个默认地址的用户只保留最新添加的一个"""
+    Address = apps.get_model('shoppingmall', 'Address')
+
+    duplicates = (Address.objects.filter(is_default=True).values('user_id')
+                  .annotate(n=Count('id'), keep=Max('id')).filter(n__gt=1))
+    for row in duplicates.iterator():
+        Address.objects.filter(user_id=row['user_id'], is_default=True).exclude(id=row['keep']).update(is_default=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0021_unique_cart_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_one_default_address, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='address',
+            name='address_user_default_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='address',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('user',), name='unique_default_address'),
+        ),
+    ]
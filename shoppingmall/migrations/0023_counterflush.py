@@ -0,0 +1,21 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0022_unique_default_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounterFlush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.CharField(max_length=32, unique=True)),
+                ('applied_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
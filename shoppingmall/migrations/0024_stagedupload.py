@@ -0,0 +1,22 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0023_counterflush'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=64)),
+                ('image', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.9 on 2026-10-18 18:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppingmall', '0024_stagedupload'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='advertisement',
+            name='ad_thumbnail',
+        ),
+    ]
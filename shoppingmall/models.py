@@ -1,13 +1,16 @@
+from django.contrib.auth.hashers import check_password, make_password
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import OuterRef, Q, Subquery
 
 
 class Users(models.Model):
     name = models.CharField(max_length=20, null=False, unique=True)
     icon = models.ImageField(default="", upload_to="user_icon")
+    icon_thumbnail = models.ImageField(default="", blank=True, upload_to="derivatives")
     email = models.EmailField(default="")
     phone = models.CharField(max_length=20, null=True)
-    password = models.CharField(max_length=20, null=False, default="123456")
+    password = models.CharField(max_length=128, null=False, default="123456")  # make_password 生成的哈希
     sex = models.CharField(max_length=1, default="m")
     login_status = models.BooleanField(default=0)
     subscribe_num = models.IntegerField(default=0, null=False)
@@ -17,12 +20,27 @@ class Users(models.Model):
     def __str__(self):
         return "username:%s" % self.name
 
+    @property
+    def is_authenticated(self):
+        """令牌认证得到的都是已登录用户，供 DRF 的 IsAuthenticated 权限判断"""
+        return True
+
+    def set_password(self, raw_password):
+        self.password = make_password(raw_password)
+
+    def check_password(self, raw_password):
+        return check_password(raw_password, self.password)
+
 
 class Fans(models.Model):
     user = models.ForeignKey(Users, db_column="user_id", related_name="user", on_delete=models.CASCADE)
     fan = models.ForeignKey(Users, db_column="fan_id", related_name="fan", on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # 查询某用户关注了谁（时间线回填、关注列表），只读索引即可得到 user_id
+        indexes = [models.Index(fields=['fan', 'user'], name='fans_fan_user_idx')]
+
     def __str__(self):
         return "user:%s,fan:%s,timestamp:%s" % (self.user, self.fan, str(self.timestamp))
 
@@ -33,11 +51,28 @@ class Address(models.Model):
     phone = models.CharField(max_length=20, default=None)
     is_default = models.BooleanField(default=False)
 
+    class Meta:
+        # 每个用户最多一个默认地址；部分唯一索引只包含 is_default 的行，同时用于默认地址查询
+        constraints = [models.UniqueConstraint(fields=['user'], condition=Q(is_default=True),
+                                               name='unique_default_address')]
+
 
 class Category(models.Model):
     name = models.CharField(primary_key=True, max_length=10)
 
 
+class BaseProduceQuerySet(models.QuerySet):
+
+    def with_listing(self):
+        """附带最低价格与首页展示图片，避免列表序列化时逐条查询"""
+        surface = ProduceImages.objects.filter(produce=OuterRef('pk'), order_number=1)
+        # 最低价使用相关子查询而不是 JOIN + GROUP BY，分页时可以按主键顺序读取并提前结束
+        min_price = Produce.objects.filter(parent_produce=OuterRef('pk')).order_by('price').values('price')[:1]
+        return self.annotate(min_price=Subquery(min_price),
+                             surface=Subquery(surface.values('image')[:1]),
+                             surface_thumbnail=Subquery(surface.values('thumbnail')[:1]))
+
+
 class BaseProduce(models.Model):
     name = models.CharField(max_length=200, null=False)
     category = models.ForeignKey(Category, on_delete=models.DO_NOTHING)
@@ -45,6 +80,24 @@ class BaseProduce(models.Model):
     comment_num = models.IntegerField(default=0)
     is_active = models.BooleanField("商品是否上架", default=1)
 
+    objects = BaseProduceQuerySet.as_manager()
+
+    class Meta:
+        # 部分索引只包含上架商品：商城首页按 id 翻页，分类按 category 过滤
+        indexes = [models.Index(fields=['id'], condition=Q(is_active=True), name='baseproduce_active_idx'),
+                   models.Index(fields=['category', 'id'], condition=Q(is_active=True),
+                                name='baseproduce_active_cat_idx')]
+
+
+class ProduceQuerySet(models.QuerySet):
+
+    def with_surface(self):
+        """附带父商品名称与首页展示图片，避免子商品序列化时逐条查询"""
+        surface = ProduceImages.objects.filter(produce=OuterRef('parent_produce'), order_number=1)
+        return self.select_related('parent_produce').annotate(
+            surface=Subquery(surface.values('image')[:1]),
+            surface_thumbnail=Subquery(surface.values('thumbnail')[:1]))
+
 
 # 子商品
 class Produce(models.Model):
@@ -52,20 +105,67 @@ class Produce(models.Model):
     parent_produce = models.ForeignKey(BaseProduce, on_delete=models.CASCADE, related_name="sub_produce")
     price = models.FloatField(null=False)
     order = models.IntegerField(default=1)
+    stock = models.IntegerField(null=True, blank=True)  # 库存，为空表示不限库存
+
+    objects = ProduceQuerySet.as_manager()
 
     class Meta:
         unique_together = [['child_name', 'parent_produce'], ['order', 'parent_produce']]
+        indexes = [models.Index(fields=['parent_produce', 'price'], name='produce_parent_price_idx')]
 
 
 class ProduceImages(models.Model):
     produce = models.ForeignKey(BaseProduce, on_delete=models.CASCADE, related_name="images")
     order_number = models.IntegerField(null=False)
     image = models.ImageField(default=None, upload_to="produce_imgs")
+    thumbnail = models.ImageField(default="", blank=True, upload_to="derivatives")
+    preview = models.ImageField(default="", blank=True, upload_to="derivatives")
 
     class Meta:
         unique_together = [['produce', 'order_number']]
 
 
+class CategoryProduceIndex(models.Model):
+    """商品分类列表索引：冗余存储最低价格和首页展示图片，由 signals 维护"""
+    base_produce = models.OneToOneField(BaseProduce, on_delete=models.CASCADE, primary_key=True,
+                                        related_name="category_index")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="produce_index")
+    name = models.CharField(max_length=200)
+    min_price = models.FloatField(null=True)
+    surface = models.CharField(max_length=100, default="")
+
+    class Meta:
+        indexes = [models.Index(fields=['category', 'base_produce'])]
+
+    @classmethod
+    def refresh(cls, base_produce_id):
+        """重新计算单个商品的索引行，商品下架或删除时移除"""
+        produce = BaseProduce.objects.filter(pk=base_produce_id, is_active=True).with_listing().first()
+        if produce is None:
+            cls.objects.filter(base_produce_id=base_produce_id).delete()
+            return None
+        surface = produce.surface_thumbnail or produce.surface or ""
+        index, _ = cls.objects.update_or_create(base_produce_id=produce.id,
+                                                defaults={'category_id': produce.category_id,
+                                                          'name': produce.name,
+                                                          'min_price': produce.min_price,
+                                                          'surface': surface})
+        return index
+
+    @classmethod
+    def rebuild(cls):
+        """全量重建索引，用于绕过 signals 的批量修改之后"""
+        produces = BaseProduce.objects.filter(is_active=True).with_listing()
+        rows = [cls(base_produce_id=produce.id,
+                    category_id=produce.category_id,
+                    name=produce.name,
+                    min_price=produce.min_price,
+                    surface=produce.surface_thumbnail or produce.surface or "") for produce in produces]
+        cls.objects.all().delete()
+        cls.objects.bulk_create(rows, batch_size=500)
+        return len(rows)
+
+
 class Order(models.Model):
     user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='orders')
     produce = models.ForeignKey(Produce, on_delete=models.CASCADE, default="", related_name="produce")
@@ -76,6 +176,7 @@ class Order(models.Model):
 
     class Meta:
         unique_together = [['user', 'produce', 'paymentTime']]
+        indexes = [models.Index(fields=['user', '-paymentTime'], name='order_user_time_idx')]
 
 
 class ProduceComment(models.Model):
@@ -86,6 +187,39 @@ class ProduceComment(models.Model):
     comment_like_num = models.IntegerField(default=0)
     star = models.IntegerField(validators=[MaxValueValidator(5), MinValueValidator(1)])
 
+    class Meta:
+        # 对应 ProduceCommentCursorPagination 的三种排序
+        indexes = [
+            models.Index(fields=['base_produce', '-commentTime'], name='comment_produce_time_idx'),
+            models.Index(fields=['base_produce', '-star', '-commentTime'], name='comment_produce_star_idx'),
+            models.Index(fields=['base_produce', '-comment_like_num', '-commentTime'],
+                         name='comment_produce_likes_idx'),
+        ]
+
+
+class ProduceRating(models.Model):
+    """商品评分汇总：各星级评论数与总分，评论创建时增量更新"""
+    base_produce = models.OneToOneField(BaseProduce, on_delete=models.CASCADE, primary_key=True, related_name="rating")
+    star_1 = models.IntegerField(default=0)
+    star_2 = models.IntegerField(default=0)
+    star_3 = models.IntegerField(default=0)
+    star_4 = models.IntegerField(default=0)
+    star_5 = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    star_sum = models.IntegerField(default=0)
+
+    @staticmethod
+    def star_field(star):
+        return 'star_%d' % min(5, max(1, int(star)))
+
+    @property
+    def average(self):
+        return round(self.star_sum / self.total, 2) if self.total else None
+
+    @property
+    def histogram(self):
+        return {star: getattr(self, 'star_%d' % star) for star in range(1, 6)}
+
 
 class Advertisement(models.Model):
     produce = models.ForeignKey(BaseProduce, on_delete=models.CASCADE)
@@ -97,12 +231,30 @@ class CartItem(models.Model):
     produce = models.ForeignKey(Produce, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
 
+    class Meta:
+        # 同一子商品在购物车中只有一条，加入时累加数量
+        constraints = [models.UniqueConstraint(fields=['user', 'produce'], name='unique_cart_item')]
+
 
 class Favorites(models.Model):
     user = models.ForeignKey(Users, on_delete=models.CASCADE)
     produce = models.ForeignKey(BaseProduce, on_delete=models.CASCADE)
 
 
+class PostQuerySet(models.QuerySet):
+
+    def with_surface(self):
+        """附带帖子封面图片（order_number=1），避免列表序列化时逐条查询"""
+        surface = PostImages.objects.filter(post=OuterRef('pk'), order_number=1)
+        return self.annotate(surface=Subquery(surface.values('image')[:1]),
+                             surface_thumbnail=Subquery(surface.values('thumbnail')[:1]))
+
+    def with_detail(self):
+        """帖子详情所需的作者、图片和评论（含评论用户）"""
+        comments = PostComments.objects.select_related('user')
+        return self.select_related('user').prefetch_related('images', models.Prefetch('comments', queryset=comments))
+
+
 class Post(models.Model):
     user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name="posts")
     title = models.CharField(max_length=20, null=False)
@@ -112,6 +264,14 @@ class Post(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=1)
 
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-timestamp'], condition=Q(is_active=True), name='post_active_time_idx'),
+            models.Index(fields=['user', '-timestamp'], name='post_user_time_idx'),
+        ]
+
     def __str__(self):
         return "user:%s, post title:%s" % (str(self.user), self.title)
 
@@ -120,6 +280,26 @@ class PostImages(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='images')
     order_number = models.IntegerField(null=False)
     image = models.ImageField(default=None, upload_to="post_imgs")
+    thumbnail = models.ImageField(default="", blank=True, upload_to="derivatives")
+    preview = models.ImageField(default="", blank=True, upload_to="derivatives")
+
+
+class StagedUpload(models.Model):
+    """两段式发帖已上传、尚未发帖的图片；token 为 upload_token 的 SHA-256，发帖时在同一事务中删除"""
+    token = models.CharField(max_length=64, db_index=True)
+    image = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class TimelineEntry(models.Model):
+    """订阅时间线收件箱：关注的用户发帖时写入，timestamp 冗余帖子发布时间用于排序"""
+    owner = models.ForeignKey(Users, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        unique_together = [['owner', 'post']]
+        indexes = [models.Index(fields=['owner', 'timestamp'])]
 
 
 class PostComments(models.Model):
@@ -134,6 +314,16 @@ class PostLike(models.Model):
     user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name="love")
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['post', 'user'], name='unique_post_like')]
+        indexes = [models.Index(fields=['user', '-timestamp'], name='postlike_user_time_idx')]
+
+
+class CounterFlush(models.Model):
+    """已写回数据库的计数增量批次，counters.flush 中断后重试时据此跳过已写回的批次"""
+    batch = models.CharField(max_length=32, unique=True)
+    applied_at = models.DateTimeField(auto_now_add=True)
+
 
 class Try:
     name = models.CharField(max_length=20)
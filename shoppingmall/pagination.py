@@ -0,0 +1,113 @@
+import binascii
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class CategoryProduceCursorPagination(CursorPagination):
+    """商品分类列表游标分页，按商品 id 顺序翻页"""
+    ordering = 'base_produce_id'
+
+
+class TimestampCursorPagination(CursorPagination):
+    """按 timestamp 倒序的游标分页，用于订阅时间线、帖子与点赞列表"""
+    ordering = '-timestamp'
+
+
+class OrderCursorPagination(CursorPagination):
+    """用户订单游标分页，按支付时间倒序"""
+    ordering = '-paymentTime'
+
+
+class ProduceCommentCursorPagination(BasePagination):
+    """商品评论键集分页，sort 参数可选 time（默认）、star、likes，均为倒序
+
+    CursorPagination 只用排序的第一个字段作游标，同星级或同点赞数的评论靠偏移量跳过，
+    偏移量超过 offset_cutoff 后无法继续翻页。这里的游标保存最后一条评论的完整排序键
+    (排序字段, commentTime, pk)，按整个元组过滤，每一页都是一次索引范围查询。
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    sort = 'time'
+    orderings = {
+        'time': ('commentTime', 'pk'),
+        'star': ('star', 'commentTime', 'pk'),
+        'likes': ('comment_like_num', 'commentTime', 'pk'),
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.fields = self.orderings.get(request.query_params.get('sort'), self.orderings[self.sort])
+        position, reverse = self.decode_cursor(request)
+
+        if position is not None:
+            # 正向取排序键小于游标的评论，反向（上一页）取大于游标的评论
+            queryset = queryset.filter(self.after(position, 'gt' if reverse else 'lt'))
+        ordering = self.fields if reverse else ['-' + field for field in self.fields]
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # 正向翻页：后面还有评论时有下一页，带游标时有上一页；反向翻页相反
+        has_next, has_previous = (True, has_more) if reverse else (has_more, position is not None)
+        self.next_position = self.key(rows[-1]) if rows and has_next else None
+        self.previous_position = self.key(rows[0]) if rows and has_previous else None
+        return rows
+
+    def after(self, position, lookup):
+        """(a, b, c) 与游标逐字段比较：a 越过，或 a 相等且 b 越过，或 a、b 相等且 c 越过"""
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            equal = {self.fields[j]: position[j] for j in range(i)}
+            condition |= Q(**equal, **{'%s__%s' % (field, lookup): position[i]})
+        return condition
+
+    def key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if len(data['p']) != len(self.fields):
+                raise ValueError
+            position = [parse_datetime(value) if field == 'commentTime' else int(value)
+                        for field, value in zip(self.fields, data['p'])]
+            if None in position:
+                raise ValueError
+            return position, bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in position]
+        data = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = b64encode(data.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        return self.encode_cursor(self.next_position, False) if self.next_position is not None else None
+
+    def get_previous_link(self):
+        return self.encode_cursor(self.previous_position, True) if self.previous_position is not None else None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
@@ -0,0 +1,118 @@
+"""
+网站状态探测：一次检查多个地址，共用一个 httpx.AsyncClient 连接池并发请求，同一主机复用 keep-alive 连接。
+能返回状态码的结果缓存 PROBE_CACHE_TIMEOUT，无法访问或 5xx 的结果缓存较短的 PROBE_NEGATIVE_TIMEOUT，
+不可达的主机不会每次都重新探测。多个 worker 同时探测同一地址时通过 cache.add 加锁，
+只有拿到锁的 worker 发起请求，其余等待缓存中的结果。锁的值是每次探测随机生成的令牌，
+释放时只删除仍是自己令牌的锁，不会误删过期后被其他 worker 重新拿到的锁。
+"""
+import asyncio
+import hashlib
+import time
+import uuid
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+
+UNAVAILABLE = 'Not available'
+
+CACHE_TIMEOUT = getattr(settings, 'PROBE_CACHE_TIMEOUT', 60 * 60)
+NEGATIVE_TIMEOUT = getattr(settings, 'PROBE_NEGATIVE_TIMEOUT', 5 * 60)
+REQUEST_TIMEOUT = getattr(settings, 'PROBE_TIMEOUT', 10)
+CONCURRENCY = getattr(settings, 'PROBE_CONCURRENCY', 20)
+# 锁的过期时间要大于一次探测的最长耗时，持锁的 worker 异常退出后锁自动释放
+LOCK_TIMEOUT = REQUEST_TIMEOUT + 5
+POLL_INTERVAL = 0.1
+
+
+def normalize(url):
+    return url if url.startswith('http') else f'https://{url}'
+
+
+def _status_key(url):
+    return 'probe:status:%s' % hashlib.sha256(url.encode()).hexdigest()
+
+
+def _lock_key(url):
+    return 'probe:lock:%s' % hashlib.sha256(url.encode()).hexdigest()
+
+
+def is_negative(status):
+    return status == UNAVAILABLE or status >= 500
+
+
+async def fetch_all(urls):
+    """并发请求 urls，返回 {url: 状态码或 UNAVAILABLE}；只读取响应头，不下载响应体
+
+    REQUEST_TIMEOUT 只限制单次连接与读取，持续缓慢返回数据的地址可能拖过锁的有效期，
+    因此整批请求另有 REQUEST_TIMEOUT 的总时限，到期未完成的地址记为 UNAVAILABLE。
+    """
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    async with httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT, follow_redirects=True) as client:
+        async def fetch(url):
+            try:
+                async with client.stream('GET', url) as response:
+                    return response.status_code
+            except httpx.HTTPError:
+                return UNAVAILABLE
+
+        tasks = [asyncio.ensure_future(fetch(url)) for url in urls]
+        _, pending = await asyncio.wait(tasks, timeout=REQUEST_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return {url: UNAVAILABLE if task in pending else task.result() for url, task in zip(urls, tasks)}
+
+
+def _cached(urls):
+    found = cache.get_many([_status_key(url) for url in urls])
+    return {url: found[_status_key(url)] for url in urls if _status_key(url) in found}
+
+
+def _store(results):
+    positive = {_status_key(url): status for url, status in results.items() if not is_negative(status)}
+    negative = {_status_key(url): status for url, status in results.items() if is_negative(status)}
+    if positive:
+        cache.set_many(positive, CACHE_TIMEOUT)
+    if negative:
+        cache.set_many(negative, NEGATIVE_TIMEOUT)
+
+
+def _probe_locked(urls):
+    """对拿到锁的地址发起请求并写入缓存，返回拿不到锁（其他 worker 正在探测）的地址"""
+    token = uuid.uuid4().hex
+    mine = [url for url in urls if cache.add(_lock_key(url), token, LOCK_TIMEOUT)]
+    if not mine:
+        return urls, {}
+    try:
+        results = asyncio.run(fetch_all(mine))
+        _store(results)
+    finally:
+        _release([_lock_key(url) for url in mine], token)
+    return [url for url in urls if url not in results], results
+
+
+def _release(keys, token):
+    """只删除值仍为 token 的锁；比较与删除之间锁恰好过期并被抢到的窗口极短，可以接受"""
+    held = cache.get_many(keys)
+    cache.delete_many([key for key in keys if held.get(key) == token])
+
+
+def probe(urls):
+    """返回 {地址: 状态码或 UNAVAILABLE}，地址按传入顺序去重"""
+    urls = list(dict.fromkeys(normalize(url) for url in urls))
+    results = _cached(urls)
+    waiting, fetched = _probe_locked([url for url in urls if url not in results])
+    results.update(fetched)
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while waiting:
+        time.sleep(POLL_INTERVAL)
+        results.update(_cached(waiting))
+        waiting = [url for url in waiting if url not in results]
+        # 持锁的 worker 没有写入结果时（例如已退出），锁过期后由当前 worker 自己探测
+        if waiting and time.monotonic() > deadline:
+            waiting, fetched = _probe_locked(waiting)
+            results.update(fetched)
+            deadline = time.monotonic() + LOCK_TIMEOUT
+    return {url: results[url] for url in urls}
@@ -0,0 +1,190 @@
+"""
+请求性能采样：记录每个请求的查询数、SQL 耗时、重复查询指纹以及 SerializerMethodField 耗时，
+按接口滚动汇总。各进程定期将汇总结果写入缓存，由 profiling_report 命令读取。
+查询通过安装在每个线程数据库连接上的 execute_wrapper 记录到 ContextVar 中的当前请求，
+异步视图在线程池中执行的查询也能记录。
+"""
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.fields import SerializerMethodField
+
+WINDOW = getattr(settings, 'PROFILING_WINDOW', 500)
+PUBLISH_INTERVAL = getattr(settings, 'PROFILING_PUBLISH_INTERVAL', 30)
+WORKERS_KEY = 'profiling:workers'
+WORKER_TTL = 24 * 60 * 60
+
+_current = ContextVar('request_profile', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)')
+
+
+def fingerprint(sql):
+    """去掉 SQL 中的字面量与 IN 列表长度，用于识别同一语句的重复执行"""
+    sql = _NUMBER.sub('?', _STRING.sub('?', sql))
+    return _IN_LIST.sub('(...)', sql)
+
+
+class RequestProfile:
+    """单个请求的采样数据，同时作为 connection.execute_wrapper 使用"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.field_time = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.durations = deque(maxlen=WINDOW)
+        self.queries = deque(maxlen=WINDOW)
+        self.sql_times = deque(maxlen=WINDOW)
+        self.duplicates = Counter()
+        self.field_time = Counter()
+
+    def add(self, duration, profile):
+        self.requests += 1
+        self.durations.append(duration)
+        self.queries.append(profile.queries)
+        self.sql_times.append(profile.sql_time)
+        self.duplicates.update(profile.duplicates())
+        self.field_time.update(profile.field_time)
+
+    def summary(self):
+        durations = sorted(self.durations)
+        samples = len(durations)
+        return {
+            'requests': self.requests,
+            'samples': samples,
+            'p50_ms': round(durations[samples // 2] * 1000, 2),
+            'p95_ms': round(durations[min(samples - 1, int(samples * 0.95))] * 1000, 2),
+            'avg_queries': round(sum(self.queries) / samples, 2),
+            'avg_sql_ms': round(sum(self.sql_times) / samples * 1000, 2),
+            'total_sql_ms': round(sum(self.sql_times) * 1000, 2),
+            'duplicate_queries': [{'sql': sql, 'count': count} for sql, count in self.duplicates.most_common(5)],
+            'slowest_fields': [{'field': field, 'total_ms': round(seconds * 1000, 2)}
+                               for field, seconds in self.field_time.most_common(5)],
+        }
+
+
+class ProfileReport:
+    """进程内按接口汇总的滚动报告"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointStats)
+        self.published = 0.0
+        self.worker = '%s:%s' % (socket.gethostname(), os.getpid())
+
+    def add(self, endpoint, duration, profile):
+        with self.lock:
+            self.endpoints[endpoint].add(duration, profile)
+
+    def snapshot(self):
+        with self.lock:
+            return {endpoint: stats.summary() for endpoint, stats in self.endpoints.items()}
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def maybe_publish(self):
+        now = time.monotonic()
+        if now - self.published < PUBLISH_INTERVAL:
+            return
+        self.published = now
+        self.publish()
+
+    def publish(self):
+        key = 'profiling:report:%s' % self.worker
+        cache.set(key, {'worker': self.worker, 'time': time.time(), 'endpoints': self.snapshot()}, WORKER_TTL)
+        workers = cache.get(WORKERS_KEY, set())
+        if key not in workers:
+            cache.set(WORKERS_KEY, workers | {key}, WORKER_TTL)
+
+
+def collect_reports():
+    """读取所有进程发布的报告"""
+    keys = cache.get(WORKERS_KEY, set())
+    return [report for report in cache.get_many(list(keys)).values()]
+
+
+report = ProfileReport()
+
+_instrumented = False
+
+
+def instrument_serializers():
+    """为 SerializerMethodField 计时，未采样的请求只多一次 ContextVar 读取"""
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+    to_representation = SerializerMethodField.to_representation
+
+    def timed_to_representation(self, value):
+        profile = _current.get()
+        if profile is None:
+            return to_representation(self, value)
+        start = time.perf_counter()
+        try:
+            return to_representation(self, value)
+        finally:
+            profile.field_time['%s.%s' % (type(self.parent).__name__, self.field_name)] += \
+                time.perf_counter() - start
+
+    SerializerMethodField.to_representation = timed_to_representation
+
+
+_connections_instrumented = False
+
+
+def record_query(execute, sql, params, many, context):
+    """安装在数据库连接上的 execute_wrapper，只记录正在采样的请求"""
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def install(sender=None, connection=None, **kwargs):
+    """为 connection（默认为当前线程的全部连接）安装 record_query；新建的连接通过 connection_created 自动安装"""
+    if not _connections_instrumented:
+        return
+    for conn in [connection] if connection is not None else connections.all():
+        if record_query not in conn.execute_wrappers:
+            conn.execute_wrappers.append(record_query)
+
+
+def instrument_connections():
+    global _connections_instrumented
+    if _connections_instrumented:
+        return
+    _connections_instrumented = True
+    connection_created.connect(install, dispatch_uid='profiling_install')
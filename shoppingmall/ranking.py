@@ -0,0 +1,98 @@
+"""
+推荐流：Celery 定时任务 rebuild_recommend_feed 按发布时间、点赞数、评论数为最近的帖子打分，
+结果写入 Redis 有序集合。推荐接口按排名分页读取帖子 id，再用一次查询取出该页帖子，
+请求耗时只与页大小有关，与帖子总数无关。
+缓存后端不是 Redis 时（例如测试中的进程内缓存）退化为在缓存中保存排好序的 id 列表。
+"""
+import heapq
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import Post
+
+FEED_KEY = 'recommend:feed'
+FEED_SIZE = getattr(settings, 'RECOMMEND_FEED_SIZE', 1000)
+WINDOW_DAYS = getattr(settings, 'RECOMMEND_WINDOW_DAYS', 30)
+
+# 热度 = (1 + 点赞数 * LIKE_WEIGHT + 评论数 * COMMENT_WEIGHT) / (发布小时数 + 2) ^ GRAVITY
+LIKE_WEIGHT = 1
+COMMENT_WEIGHT = 2
+GRAVITY = 1.5
+
+
+def score(like_num, comment_num, timestamp, now):
+    hours = max((now - timestamp).total_seconds(), 0) / 3600
+    return (1 + like_num * LIKE_WEIGHT + comment_num * COMMENT_WEIGHT) / (hours + 2) ** GRAVITY
+
+
+def _redis():
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        return None
+
+
+def rebuild(now=None):
+    """重新计算最近 WINDOW_DAYS 天帖子的热度，保留前 FEED_SIZE 名，返回写入的帖子数"""
+    now = now or timezone.now()
+    rows = Post.objects.filter(is_active=True, timestamp__gte=now - timedelta(days=WINDOW_DAYS)) \
+        .values_list('id', 'like_num', 'comment_num', 'timestamp')
+    ranked = heapq.nlargest(FEED_SIZE, ((score(like_num, comment_num, timestamp, now), post_id)
+                                        for post_id, like_num, comment_num, timestamp in rows.iterator()))
+
+    redis = _redis()
+    if redis is None:
+        cache.set(FEED_KEY, [post_id for _, post_id in ranked], None)
+        return len(ranked)
+    # 先写入临时键再 RENAME，读取方不会看到写了一半的排名
+    building = FEED_KEY + ':building'
+    pipeline = redis.pipeline()
+    pipeline.delete(building)
+    if ranked:
+        pipeline.zadd(building, {post_id: value for value, post_id in ranked})
+        pipeline.rename(building, FEED_KEY)
+    else:
+        pipeline.delete(FEED_KEY)
+    pipeline.execute()
+    return len(ranked)
+
+
+class RankedFeed:
+    """按排名排列的帖子序列，分页器切片时才读取该页的 id 并用一次查询取出帖子"""
+
+    def __init__(self, queryset, redis=None, count=None, ids=None):
+        self.queryset = queryset
+        self.redis = redis
+        self.count = count
+        self.ids = ids
+
+    def __len__(self):
+        return self.count if self.redis is not None else len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if self.redis is not None:
+            start, stop = index.start or 0, index.stop
+            ids = [int(post_id) for post_id in
+                   self.redis.zrevrange(FEED_KEY, start, -1 if stop is None else stop - 1)]
+        else:
+            ids = self.ids[index]
+        # 排名计算之后被删除或隐藏的帖子直接跳过
+        posts = self.queryset.filter(is_active=True).in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+def ranked_feed(queryset):
+    """返回按热度排序的帖子序列，排名尚未生成或为空时返回按时间倒序的 queryset"""
+    redis = _redis()
+    if redis is not None:
+        # 不存在的键 ZCARD 为 0，一条命令同时判断是否已生成并得到总数
+        count = redis.zcard(FEED_KEY)
+        return RankedFeed(queryset, redis=redis, count=count) if count else queryset
+    ids = cache.get(FEED_KEY)
+    return RankedFeed(queryset, ids=ids) if ids else queryset
@@ -0,0 +1,61 @@
+"""
+读写分离：写操作和默认的读操作使用 default（主库），
+ReadReplicaMixin 标记的只读请求期间的读操作随机发往 DATABASES 中配置的只读副本。
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+_use_replica = ContextVar('use_replica', default=False)
+_pin_primary = ContextVar('pin_primary', default=False)
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias != PRIMARY]
+
+
+@contextmanager
+def read_from_replica():
+    """块内的读操作发往只读副本，没有配置副本或处在 read_from_primary 块内时仍使用主库"""
+    token = _use_replica.set(not _pin_primary.get())
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """块内的读操作使用主库，包括块内再进入的 read_from_replica（例如在块内请求只读接口）；
+    用于写入缓存的数据，避免副本延迟把旧数据写进缓存"""
+    replica_token = _use_replica.set(False)
+    pin_token = _pin_primary.set(True)
+    try:
+        yield
+    finally:
+        _pin_primary.reset(pin_token)
+        _use_replica.reset(replica_token)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            aliases = replicas()
+            if aliases:
+                return random.choice(aliases)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本与主库是同一份数据
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
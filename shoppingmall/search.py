@@ -0,0 +1,198 @@
+"""
+商品与帖子全文搜索：SQLite 使用 FTS5 虚拟表，PostgreSQL 使用 tsvector + GIN 索引，表由迁移 0020 创建。
+两种数据库的分词器都不能切分中文，写入和查询前先按 CJK 二元组（bigram）切分：
+"蓝牙耳机" -> "蓝牙 牙耳 耳机 机"，每个连续汉字串末尾补一个单字，任意位置的单字都能作为前缀匹配。
+查询的最后一个词按前缀匹配，用于输入联想。索引由 signals 在写入商品、子商品、帖子时同步刷新。
+"""
+import re
+
+from django.db import connections, router, transaction
+
+from .models import BaseProduce, Post, Produce
+
+PRODUCE = 'produce'
+POST = 'post'
+TABLE = 'shoppingmall_search'
+
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN = re.compile(r'[%s]+|[^\W_%s]+' % (_CJK, _CJK))
+_CJK_RUN = re.compile(r'[%s]' % _CJK)
+
+
+def tokenize(text, query=False):
+    """切分为小写词与汉字二元组；查询时多字汉字串不补末尾单字"""
+    tokens = []
+    for run in _TOKEN.findall((text or '').lower()):
+        if not _CJK_RUN.match(run) or len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        if not query:
+            tokens.append(run[-1])
+    return tokens
+
+
+class SqliteIndex:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def replace(self, kind, object_id, label, title, body):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE kind = %%s AND object_id = %%s' % TABLE, [kind, object_id])
+            cursor.execute('INSERT INTO %s (kind, object_id, label, title, body) VALUES (%%s, %%s, %%s, %%s, %%s)'
+                           % TABLE, [kind, object_id, label, ' '.join(tokenize(title)), ' '.join(tokenize(body))])
+
+    def delete(self, kind, object_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE kind = %%s AND object_id = %%s' % TABLE, [kind, object_id])
+
+    def clear(self, kind):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE kind = %%s' % TABLE, [kind])
+
+    def match(self, tokens):
+        # 每个词加引号避免被解析为 FTS5 语法，最后一个词前缀匹配
+        return ' '.join('"%s"' % token for token in tokens[:-1]) + ' "%s"*' % tokens[-1]
+
+    def count(self, kind, tokens):
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM %s WHERE %s MATCH %%s AND kind = %%s' % (TABLE, TABLE),
+                           [self.match(tokens), kind])
+            return cursor.fetchone()[0]
+
+    def search(self, kind, tokens, offset, limit):
+        """返回 [(object_id, label)]，标题列权重为正文的 10 倍"""
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT object_id, label FROM %s WHERE %s MATCH %%s AND kind = %%s '
+                           'ORDER BY bm25(%s, 0, 0, 0, 10.0, 1.0) LIMIT %%s OFFSET %%s' % (TABLE, TABLE, TABLE),
+                           [self.match(tokens), kind, limit, offset])
+            return cursor.fetchall()
+
+
+class PostgresIndex(SqliteIndex):
+
+    def replace(self, kind, object_id, label, title, body):
+        with self.connection.cursor() as cursor:
+            cursor.execute("INSERT INTO %s (kind, object_id, label, document) VALUES "
+                           "(%%s, %%s, %%s, setweight(to_tsvector('simple', %%s), 'A') || "
+                           "setweight(to_tsvector('simple', %%s), 'B')) "
+                           "ON CONFLICT (kind, object_id) DO UPDATE SET label = EXCLUDED.label, "
+                           "document = EXCLUDED.document" % TABLE,
+                           [kind, object_id, label, ' '.join(tokenize(title)), ' '.join(tokenize(body))])
+
+    def match(self, tokens):
+        return ' & '.join(tokens[:-1] + ['%s:*' % tokens[-1]])
+
+    def count(self, kind, tokens):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM %s WHERE document @@ to_tsquery('simple', %%s) AND kind = %%s"
+                           % TABLE, [self.match(tokens), kind])
+            return cursor.fetchone()[0]
+
+    def search(self, kind, tokens, offset, limit):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT object_id, label FROM %s WHERE document @@ to_tsquery('simple', %%s) "
+                           "AND kind = %%s ORDER BY ts_rank(document, to_tsquery('simple', %%s)) DESC, object_id "
+                           "LIMIT %%s OFFSET %%s" % TABLE,
+                           [self.match(tokens), kind, self.match(tokens), limit, offset])
+            return cursor.fetchall()
+
+
+BACKENDS = {'sqlite': SqliteIndex, 'postgresql': PostgresIndex}
+
+
+def _index(write=False):
+    """返回当前数据库的索引，不支持的数据库返回 None"""
+    alias = router.db_for_write(Post) if write else router.db_for_read(Post)
+    backend = BACKENDS.get(connections[alias].vendor)
+    return backend(connections[alias]) if backend else None
+
+
+def refresh_produce(base_produce_id):
+    """重新索引单个商品（名称 + 子商品名称），商品下架或删除时移除"""
+    index = _index(write=True)
+    if index is None:
+        return
+    produce = BaseProduce.objects.filter(pk=base_produce_id, is_active=True).first()
+    if produce is None:
+        index.delete(PRODUCE, base_produce_id)
+        return
+    children = Produce.objects.filter(parent_produce=base_produce_id).values_list('child_name', flat=True)
+    index.replace(PRODUCE, produce.id, produce.name, produce.name, ' '.join(children))
+
+
+def refresh_post(post_id):
+    index = _index(write=True)
+    if index is None:
+        return
+    post = Post.objects.filter(pk=post_id, is_active=True).first()
+    if post is None:
+        index.delete(POST, post_id)
+        return
+    index.replace(POST, post.id, post.title, post.title, post.content)
+
+
+def rebuild():
+    """全量重建索引，返回 {类型: 文档数}；在一个事务中完成，重建期间的搜索仍读到旧索引"""
+    index = _index(write=True)
+    if index is None:
+        return {}
+    children = {}
+    for parent_id, child_name in Produce.objects.values_list('parent_produce_id', 'child_name').iterator():
+        children.setdefault(parent_id, []).append(child_name)
+    produces = BaseProduce.objects.filter(is_active=True).values_list('id', 'name')
+    posts = Post.objects.filter(is_active=True).values_list('id', 'title', 'content')
+    with transaction.atomic(using=index.connection.alias):
+        index.clear(PRODUCE)
+        for produce_id, name in produces.iterator():
+            index.replace(PRODUCE, produce_id, name, name, ' '.join(children.get(produce_id, ())))
+        index.clear(POST)
+        for post_id, title, content in posts.iterator():
+            index.replace(POST, post_id, title, title, content)
+        return {PRODUCE: produces.count(), POST: posts.count()}
+
+
+class SearchResults:
+    """按相关度排列的搜索结果，分页器切片时读取该页的 id 并用一次查询取出对象"""
+
+    def __init__(self, index, kind, tokens, queryset):
+        self.index = index
+        self.kind = kind
+        self.tokens = tokens
+        self.queryset = queryset
+
+    def __len__(self):
+        return self.index.count(self.kind, self.tokens)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        ids = [object_id for object_id, _ in self.index.search(self.kind, self.tokens, start, index.stop - start)]
+        objects = self.queryset.in_bulk(ids)
+        return [objects[object_id] for object_id in ids if object_id in objects]
+
+
+# 不支持全文索引的数据库退化为按标题模糊匹配
+FALLBACK_LOOKUPS = {PRODUCE: 'name__icontains', POST: 'title__icontains'}
+
+
+def search(kind, text, queryset):
+    """返回可分页的搜索结果，没有可搜索的词时返回空查询集"""
+    tokens = tokenize(text, query=True)
+    if not tokens:
+        return queryset.none()
+    index = _index()
+    if index is None:
+        return queryset.filter(**{FALLBACK_LOOKUPS[kind]: text.strip()})
+    return SearchResults(index, kind, tokens, queryset)
+
+
+def suggest(kind, text, limit=10):
+    """输入联想：返回前 limit 个匹配结果的 id 与标题，只查询索引表"""
+    tokens = tokenize(text, query=True)
+    index = _index()
+    if not tokens or index is None:
+        return []
+    return [{'id': object_id, 'label': label} for object_id, label in index.search(kind, tokens, 0, limit)]
@@ -0,0 +1,84 @@
+"""
+合成测试数据：用户、粉丝、商品（子商品与图片）、订单与评论、帖子、点赞、购物车。
+供查询预算测试与查询计划检查使用，图片只写入路径不生成文件。
+"""
+import random
+
+from django.contrib.auth.hashers import make_password
+
+from .models import *
+
+ORDER_STATUS = ['未发货', '待收货', '已收货']
+SEED_PASSWORD = 'password'
+
+
+def seed_dataset(users=20, follows=5, categories=3, produces_per_category=10, sub_produces=3, images=3,
+                 orders_per_user=5, posts_per_user=3, post_images=2, likes_per_user=10, comments_per_user=5,
+                 cart_items=3, seed=0):
+    """批量写入一套关联完整的数据并返回主要对象，数据量可以通过参数调整"""
+    rng = random.Random(seed)
+
+    # 所有用户使用同一个密码，只计算一次哈希
+    password = make_password(SEED_PASSWORD)
+    all_users = [Users.objects.create(name='user%d' % i, password=password, icon='user_icon/%d.gif' % i)
+                 for i in range(users)]
+    for user in all_users:
+        for followee in rng.sample([u for u in all_users if u != user], min(follows, users - 1)):
+            Fans.objects.create(user=followee, fan=user)
+
+    addresses = {}
+    for user in all_users:
+        addresses[user.id] = [Address.objects.create(user=user, address_inf='address %d-%d' % (user.id, i),
+                                                     phone='1380000%04d' % user.id, is_default=(i == 0))
+                              for i in range(2)]
+
+    all_categories = [Category.objects.create(name='category%d' % i) for i in range(categories)]
+    all_produces = []
+    all_sub_produces = []
+    for category in all_categories:
+        for i in range(produces_per_category):
+            produce = BaseProduce.objects.create(name='%s-produce%d' % (category.name, i), category=category)
+            all_produces.append(produce)
+            for j in range(sub_produces):
+                all_sub_produces.append(Produce.objects.create(parent_produce=produce, child_name='type%d' % j,
+                                                               price=rng.randint(10, 500), order=j + 1))
+            for j in range(images):
+                ProduceImages.objects.create(produce=produce, order_number=j + 1,
+                                             image='produce_imgs/%d_%d.gif' % (produce.id, j + 1))
+
+    all_orders = []
+    for user in all_users:
+        for i in range(orders_per_user):
+            all_orders.append(Order.objects.create(user=user, produce=rng.choice(all_sub_produces),
+                                                   address=addresses[user.id][0], quantity=rng.randint(1, 3),
+                                                   status=ORDER_STATUS[i % len(ORDER_STATUS)]))
+    for order in all_orders:
+        if order.status == '已收货':
+            ProduceComment.objects.create(order=order, base_produce=order.produce.parent_produce,
+                                          content='comment on %d' % order.id, star=rng.randint(1, 5))
+
+    all_posts = []
+    for user in all_users:
+        for i in range(posts_per_user):
+            post = Post.objects.create(user=user, title='post%d-%d' % (user.id, i), content='content ' * 20)
+            all_posts.append(post)
+            for j in range(post_images):
+                PostImages.objects.create(post=post, order_number=j + 1,
+                                          image='post_imgs/%d_%d.gif' % (post.id, j + 1))
+    for user in all_users:
+        for post in rng.sample(all_posts, min(likes_per_user, len(all_posts))):
+            PostLike.objects.create(post=post, user=user)
+        for post in rng.sample(all_posts, min(comments_per_user, len(all_posts))):
+            PostComments.objects.create(user=user, post=post, content='reply from %d' % user.id)
+        for produce in rng.sample(all_sub_produces, min(cart_items, len(all_sub_produces))):
+            CartItem.objects.create(user=user, produce=produce, quantity=rng.randint(1, 3))
+
+    return {
+        'users': all_users,
+        'addresses': addresses,
+        'categories': all_categories,
+        'produces': all_produces,
+        'sub_produces': all_sub_produces,
+        'orders': all_orders,
+        'posts': all_posts,
+    }
@@ -1,10 +1,39 @@
-from django.db.models import Min
+from contextlib import nullcontext
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Manager, Min
+from . import addresses, authentication, carts, checkout, likes, uploads
 from .models import *
 from rest_framework import serializers
 
 
+def media_url(name):
+    """将查询注解得到的图片路径转换为与 ImageField 序列化结果一致的地址"""
+    if not name:
+        return None
+    return default_storage.url(name)
+
+
+class ThumbnailImageField(serializers.ImageField):
+    """列表中使用的图片字段：source 指向原图，已生成缩略图时输出缩略图地址"""
+
+    def __init__(self, thumbnail, **kwargs):
+        self.thumbnail = thumbnail
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        original = super().get_attribute(instance)
+        if not original:
+            return original
+        return getattr(original.instance, self.thumbnail) or original
+
+
 class UserListSerializer(serializers.ModelSerializer):
     """用户简单信息序列化器"""
+    icon = ThumbnailImageField(thumbnail='icon_thumbnail')
 
     class Meta:
         model = Users
@@ -25,12 +54,45 @@ class AddressSerializer(serializers.ModelSerializer):
             'is_default',
         ]
 
+    # 新增或修改为默认地址时取消原来的默认地址，见 addresses.save
+    def create(self, validated_data):
+        make_default = validated_data.pop('is_default', False)
+        return save_address(Address(user=self.context['request'].user, **validated_data), make_default)
+
+    def update(self, instance, validated_data):
+        make_default = validated_data.pop('is_default', None)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        if make_default is False:
+            instance.is_default = False
+        return save_address(instance, bool(make_default))
+
+
+def save_address(address, make_default):
+    # 不支持行锁的数据库上并发切换默认地址仍可能违反唯一约束，返回 400 让客户端重试
+    try:
+        return addresses.save(address, make_default)
+    except IntegrityError:
+        raise serializers.ValidationError('默认地址正在被修改，请重试')
+
+
+class PostPageSerializer(serializers.ListSerializer):
+    """一页帖子：点赞状态保存在 Redis 中时一次取出整页的结果，不必逐条 SISMEMBER"""
+
+    def to_representation(self, data):
+        liked = self.context.get('liked_post_ids')
+        if hasattr(liked, 'prefetch'):
+            data = list(data.all() if isinstance(data, Manager) else data)
+            liked.prefetch(post.id for post in data)
+        return super().to_representation(data)
+
 
 class PostListSerializer(serializers.ModelSerializer):
     """帖子简单信息序列化器"""
     surface = serializers.SerializerMethodField("get_surface")
     user = serializers.CharField(source='user.name')
-    user_icon = serializers.ImageField(source='user.icon')
+    user_icon = ThumbnailImageField(source='user.icon', thumbnail='icon_thumbnail')
+    is_liked = serializers.SerializerMethodField('get_is_liked')
 
     class Meta:
         model = Post
@@ -39,9 +101,21 @@ class PostListSerializer(serializers.ModelSerializer):
                   'user_icon',
                   'user',
                   'like_num',
+                  'is_liked',
                   'surface']
+        list_serializer_class = PostPageSerializer
+
+    # 视图通过 context 传入当前用户点赞过的帖子 id，未知用户时为 null
+    def get_is_liked(self, obj):
+        liked = self.context.get('liked_post_ids')
+        if liked is None:
+            return None
+        return obj.id in liked
 
+    # 优先使用 with_surface() 的注解结果
     def get_surface(self, obj):
+        if hasattr(obj, 'surface'):
+            return media_url(obj.surface_thumbnail or obj.surface)
         pic = PostImages.objects.get(post=obj.id, order_number=1)
         ser_pic = PostImageSerializer(instance=pic)
         return ser_pic.data.get("image")
@@ -95,7 +169,10 @@ class ProduceDetailSerializer(serializers.ModelSerializer):
                   'price',
                   'surface']
 
+    # 优先使用 with_surface() 的注解结果
     def get_surface(self, obj):
+        if hasattr(obj, 'surface'):
+            return media_url(obj.surface_thumbnail or obj.surface)
         return ProduceImageSerializer(instance=ProduceImages.objects.get(produce=obj.parent_produce.id,
                                                                          order_number=1)).data.get('image')
 
@@ -147,21 +224,31 @@ class OrderDetailSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         # 异常处理
-        if validated_data.get('address_id') is None:
-            raise serializers.ValidationError("地址不可以为空")
         if validated_data.get('produce_id') is None:
             raise serializers.ValidationError("购买产品不可以为空")
         if validated_data.get('quantity') is None:
             raise serializers.ValidationError("购买数量不可以为空")
 
-        address = Address.objects.get(id=validated_data.get('address_id'))
-        user = address.user
+        # 不传地址时使用缓存的默认地址
+        user = self.context['request'].user
+        if validated_data.get('address_id') is None:
+            address = addresses.default_address(user.id)
+            if address is None:
+                raise serializers.ValidationError("地址不可以为空")
+        else:
+            address = Address.objects.filter(id=validated_data.get('address_id'), user=user.id).first()
+            if address is None:
+                raise serializers.ValidationError("地址不存在")
         produce = Produce.objects.get(id=validated_data.get("produce_id"))
 
-        instance = Order.objects.create(user=user,
-                                        produce=produce,
-                                        address=address,
-                                        quantity=validated_data.get('quantity'))
+        # 不限库存的商品不需要事务
+        with transaction.atomic() if produce.stock is not None else nullcontext():
+            if produce.stock is not None and not checkout.reserve_stock(produce.id, validated_data.get('quantity')):
+                raise serializers.ValidationError("库存不足")
+            instance = Order.objects.create(user=user,
+                                            produce=produce,
+                                            address=address,
+                                            quantity=validated_data.get('quantity'))
         return instance
 
     def update(self, instance, validated_data):
@@ -174,30 +261,51 @@ class OrderDetailSerializer(serializers.ModelSerializer):
 
 class UsersOrderListSerializer(serializers.ModelSerializer):
     """用户全部订单序列化器"""
-    orders = OrderListSerializer(many=True)
+    orders = serializers.SerializerMethodField('get_orders')
 
     class Meta:
         model = Users
         fields = ['orders']
 
+    # 视图分页后通过 context 传入当前页的订单
+    def get_orders(self, obj):
+        orders = self.context.get('orders')
+        if orders is None:
+            orders = obj.orders.all()
+        return OrderListSerializer(instance=orders, many=True).data
+
 
 class UsersMyPostListSeriazlizer(serializers.ModelSerializer):
     """用户发布的所有帖子序列化器"""
-    posts = PostListSerializer(many=True)
+    posts = serializers.SerializerMethodField('get_posts')
 
     class Meta:
         model = Users
         fields = ['posts']
 
+    # 视图分页后通过 context 传入当前页的帖子
+    def get_posts(self, obj):
+        posts = self.context.get('posts')
+        if posts is None:
+            posts = obj.posts.all()
+        return PostListSerializer(instance=posts, many=True).data
+
 
 class UserLikePostsListSeriazlizer(serializers.ModelSerializer):
     """用户喜欢的所有帖子序列化器"""
-    love = PostLikeListSerializer(many=True)
+    love = serializers.SerializerMethodField('get_love')
 
     class Meta:
         model = Users
         fields = ['love']
 
+    # 视图分页后通过 context 传入当前页的点赞记录
+    def get_love(self, obj):
+        love = self.context.get('love')
+        if love is None:
+            love = obj.love.all()
+        return PostLikeListSerializer(instance=love, many=True).data
+
 
 class UserDefaultAddressSerializer(serializers.ModelSerializer):
     address = serializers.SerializerMethodField('get_default_address')
@@ -209,31 +317,86 @@ class UserDefaultAddressSerializer(serializers.ModelSerializer):
         ]
 
     def get_default_address(self, obj):
-        default_address = Address.objects.filter(user=obj, is_default=True)
+        default_address = addresses.default_address(obj.id)
 
-        ser_address = AddressSerializer(instance=default_address, many=True)
+        ser_address = AddressSerializer(instance=[default_address] if default_address else [], many=True)
         return ser_address.data
 
 
 class CartItemSerializer(serializers.ModelSerializer):
+    produce_id = serializers.IntegerField(read_only=True)
     produce = ProduceDetailSerializer()
     """购物车项序列化器"""
 
     class Meta:
         model = CartItem
         fields = [
+            'produce_id',
             'produce',
             'quantity'
         ]
 
 
+def update_cart(user_id, lines, merge=True):
+    try:
+        return carts.update(user_id, lines, merge=merge)
+    except carts.CartError as e:
+        raise serializers.ValidationError(str(e))
+
+
+class CartLineSerializer(serializers.Serializer):
+    """加入购物车的一行：子商品 id 与数量"""
+    produce_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=carts.MAX_QUANTITY, default=1)
+
+
+class CartAddSerializer(serializers.Serializer):
+    """加入购物车：传单个 produce_id/quantity，或者 items 列表一次加入多种子商品；已在购物车中的累加数量"""
+    produce_id = serializers.IntegerField(required=False, write_only=True)
+    quantity = serializers.IntegerField(min_value=1, max_value=carts.MAX_QUANTITY, default=1, write_only=True)
+    items = CartLineSerializer(many=True, required=False, allow_empty=False, write_only=True)
+
+    def validate(self, attrs):
+        if ('produce_id' in attrs) == ('items' in attrs):
+            raise serializers.ValidationError('produce_id 与 items 必须且只能提供一个')
+        if 'items' not in attrs:
+            attrs['items'] = [{'produce_id': attrs['produce_id'], 'quantity': attrs['quantity']}]
+        return attrs
+
+    def create(self, validated_data):
+        lines = [(line['produce_id'], line['quantity']) for line in validated_data['items']]
+        return {'items': update_cart(self.context['request'].user.id, lines)}
+
+    def to_representation(self, instance):
+        return {'items': CartItemSerializer(instance['items'], many=True).data}
+
+
+class CartQuantitySerializer(serializers.Serializer):
+    """修改购物车中某个子商品的数量，0 表示移除"""
+    quantity = serializers.IntegerField(min_value=0, max_value=carts.MAX_QUANTITY, write_only=True)
+
+    def update(self, instance, validated_data):
+        lines = [(instance, validated_data['quantity'])]
+        return {'items': update_cart(self.context['request'].user.id, lines, merge=False)}
+
+    def to_representation(self, instance):
+        return {'items': CartItemSerializer(instance['items'], many=True).data}
+
+
 class UserShoppingCartSerizalizer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True)
+    items = serializers.SerializerMethodField('get_items')
 
     class Meta:
         model = Users
         fields = ["items"]
 
+    # 视图分页后通过 context 传入当前页的购物车项
+    def get_items(self, obj):
+        items = self.context.get('items')
+        if items is None:
+            items = obj.items.all()
+        return CartItemSerializer(instance=items, many=True).data
+
 
 class LoginOrRegisterSerizalizer(serializers.Serializer):
     """登录注册序列化器"""
@@ -242,6 +405,7 @@ class LoginOrRegisterSerizalizer(serializers.Serializer):
     name = serializers.CharField(max_length=20, required=True)
     password = serializers.CharField(max_length=20, write_only=True)
     id = serializers.IntegerField(read_only=True, required=False)
+    token = serializers.CharField(read_only=True, help_text="之后的请求放在请求头 Authorization: Token <token> 中")
 
     def validate(self, data):
         type = data.get("type")
@@ -249,32 +413,36 @@ class LoginOrRegisterSerizalizer(serializers.Serializer):
         password = data.get("password", None)
         # 登录检测是否存在该用户名，并检查密码是否正确
         if type == "login":
-            if not Users.objects.filter(name=username).exists():
+            user = Users.objects.filter(name=username).first()
+            if user is None:
                 raise serializers.ValidationError("用户名不存在", code='authorization')
-            elif not Users.objects.filter(name=username, password=password).exists():
+            elif not user.check_password(password):
                 raise serializers.ValidationError('用户名或者密码错误', code='authorization')
         # 注册检测是否已存在用户，创建新用户
         elif type == "register":
             if Users.objects.filter(name=username).exists():
                 raise serializers.ValidationError("用户名已存在，请更换", code='authorization')
             else:
-                user = Users(name=username, password=password)
+                user = Users(name=username)
+                user.set_password(password)
                 user.save(force_insert=True)
         # 处理异常情况
         else:
             raise serializers.ValidationError("访问方式有误", code='authorization')
 
-        # 访问成功则添加用户id字段返回前端
-        data['id'] = Users.objects.get(name=username, password=password).id
+        # 访问成功则返回用户id与登录令牌
+        data['id'] = user.id
+        data['token'] = authentication.issue_token(user)
         return data
 
 
 class ProduceImageSerializer(serializers.ModelSerializer):
-    """商品图片序列化器"""
+    """商品图片序列化器，preview 为详情页使用的中图，尚未生成时为原图"""
+    preview = ThumbnailImageField(source='image', thumbnail='preview')
 
     class Meta:
         model = ProduceImages
-        fields = ['order_number', 'image']
+        fields = ['order_number', 'image', 'preview']
 
 
 class ProduceCommentSerializer(serializers.ModelSerializer):
@@ -284,6 +452,7 @@ class ProduceCommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProduceComment
         fields = ['user',
+                  'content',
                   'commentTime',
                   'comment_like_num',
                   'star',
@@ -314,7 +483,7 @@ class CommentCreateSerializer(serializers.Serializer):
         return instance
 
     def validate_order_id(self, value):
-        if not Order.objects.filter(id=value).exists():
+        if not Order.objects.filter(id=value, user=self.context['request'].user.id).exists():
             raise serializers.ValidationError("订单不存在", code='authorization')
         if ProduceComment.objects.filter(order_id=value).exists():
             raise serializers.ValidationError("该订单已有评论", code='authorization')
@@ -328,10 +497,25 @@ class CommentCreateSerializer(serializers.Serializer):
         return value
 
 
+class ProduceRatingSerializer(serializers.ModelSerializer):
+    """商品评分汇总序列化器"""
+    average = serializers.FloatField(read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = ProduceRating
+        fields = ['average',
+                  'total',
+                  'histogram']
+
+
 class BaseProduceDetailSerializer(serializers.ModelSerializer):
-    """商品详情序列化器"""
+    """商品详情序列化器，评论只返回最新几条，完整列表通过评论接口分页获取"""
+    COMMENT_PREVIEW_SIZE = 3
+
     images = ProduceImageSerializer(many=True)
-    comments = ProduceCommentSerializer(many=True)
+    comments = serializers.SerializerMethodField('get_comments')
+    rating = ProduceRatingSerializer(read_only=True)
     sub_produce = ProduceListSerializer(many=True)
 
     class Meta:
@@ -339,10 +523,15 @@ class BaseProduceDetailSerializer(serializers.ModelSerializer):
         fields = ['name',
                   'sales_num',
                   'comment_num',
+                  'rating',
                   'images',
                   'comments',
                   'sub_produce']
 
+    def get_comments(self, obj):
+        comments = obj.comments.select_related('order__user').order_by('-commentTime')[:self.COMMENT_PREVIEW_SIZE]
+        return ProduceCommentSerializer(instance=comments, many=True).data
+
 
 class MallProduceListSerializer(serializers.ModelSerializer):
     """商城首页获取商品最低价格序列化器"""
@@ -363,63 +552,61 @@ class MallBaseProduceListSerializer(serializers.ModelSerializer):
         model = BaseProduce
         fields = ['id', 'name', 'price', 'surface']
 
-    # 用于获取商城首页展示商品的最小价格
+    # 用于获取商城首页展示商品的最小价格，优先使用 with_listing() 的注解结果
     def get_min_price(self, obj):
+        if hasattr(obj, 'min_price'):
+            return obj.min_price
         all_price = Produce.objects.filter(parent_produce=obj.id).aggregate(min_price=Min('price'))
         ser_price = MallProduceListSerializer(all_price)
         return ser_price.data.get("min_price")
 
-    # 用于获取商品的首页展示图片
+    # 用于获取商品的首页展示图片，优先使用 with_listing() 的注解结果
     def get_surface(self, obj):
+        if hasattr(obj, 'surface'):
+            return media_url(obj.surface_thumbnail or obj.surface)
         pic = ProduceImages.objects.get(produce=obj.id, order_number=1)
         ser_pic = ProduceImageSerializer(instance=pic)
         return ser_pic.data.get("image")
 
 
 class PostImageSerializer(serializers.ModelSerializer):
-    """帖子图片序列化器"""
+    """帖子图片序列化器，preview 为详情页使用的中图，尚未生成时为原图"""
+    preview = ThumbnailImageField(source='image', thumbnail='preview')
 
     class Meta:
         model = PostImages
-        fields = ['order_number', 'image']
+        fields = ['order_number', 'image', 'preview']
 
 
 class PostCommentSerializer(serializers.ModelSerializer):
     user = UserListSerializer(required=False)
     post_id = serializers.IntegerField(write_only=True)
-    user_id = serializers.IntegerField(write_only=True)
 
     class Meta:
         model = PostComments
         fields = ['user',
                   'content',
                   'timestamp',
-                  'post_id',
-                  'user_id']
+                  'post_id']
         read_only_fields = [
             'timestamp'
         ]
         extra_kwargs = {'content': {'required': True}}
 
     def create(self, validated_data):
-        user_id = validated_data.get('user_id')
+        user = self.context['request'].user
         post_id = validated_data.get('post_id')
         content = validated_data.get('content')
         if post_id is None:
             raise serializers.ValidationError("帖子ID不可为空")
-        if user_id is None:
-            raise serializers.ValidationError("用户ID不可为空")
         if content is None:
             raise serializers.ValidationError("评论内容不可为空")
 
-        if not Users.objects.filter(id=user_id).exists():
-            raise serializers.ValidationError("该用户不存在")
-        if not Post.objects.filter(id=post_id).exists():
+        post = Post.objects.filter(id=post_id).first()
+        if post is None:
             raise serializers.ValidationError("该帖子不存在")
 
-        instance = PostComments.objects.create(user=Users.objects.get(pk=user_id),
-                                               post=Post.objects.get(pk=post_id),
-                                               content=content)
+        instance = PostComments.objects.create(user=user, post=post, content=content)
         return instance
 
 
@@ -439,52 +626,110 @@ class PostDetailSerializer(serializers.ModelSerializer):
                   'comments']
 
 
+class CheckoutSerializer(serializers.Serializer):
+    """购物车结算：不传 address_id 时使用默认地址，不传 cart_item_ids 时结算整个购物车"""
+    address_id = serializers.IntegerField(write_only=True, required=False)
+    cart_item_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False,
+                                          required=False, write_only=True)
+    orders = OrderDetailSerializer(many=True, read_only=True)
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        if 'address_id' in validated_data:
+            address = Address.objects.filter(pk=validated_data['address_id']).first()
+        else:
+            address = addresses.default_address(user.id)
+        if address is None:
+            raise serializers.ValidationError({'address_id': '地址不存在'})
+        try:
+            orders = checkout.checkout(user, address, validated_data.get('cart_item_ids'))
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return {'orders': orders}
+
+
 class PostCreateSerializer(serializers.Serializer):
-    user_id = serializers.IntegerField(required=True)
-    post_id = serializers.IntegerField(read_only=True)
+    """发帖：直接上传 images，或者携带 /community/uploads/ 返回的 upload_token"""
+    post_id = serializers.IntegerField(read_only=True, source='id')
     title = serializers.CharField(max_length=20, write_only=True)
     content = serializers.CharField(max_length=1000, write_only=True)
-    images = serializers.ListField(child=serializers.ImageField(allow_empty_file=False),
+    # 图片内容在 uploads.save_uploads 中并发校验，这里只检查文件非空
+    images = serializers.ListField(child=serializers.FileField(allow_empty_file=False),
                                    allow_empty=False,
-                                   max_length=6,
+                                   max_length=uploads.MAX_IMAGES,
+                                   required=False,
                                    write_only=True)
+    upload_token = serializers.CharField(required=False, write_only=True)
+
+    def validate(self, attrs):
+        if ('images' in attrs) == ('upload_token' in attrs):
+            raise serializers.ValidationError('images 与 upload_token 必须且只能提供一个')
+        try:
+            if 'upload_token' in attrs:
+                attrs['names'] = uploads.redeem_token(attrs['upload_token'], self.context['request'].user.id)
+            else:
+                attrs['names'] = uploads.save_uploads(attrs.pop('images'))
+                attrs['uploaded'] = True
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'images': e.messages})
+        return attrs
 
     def update(self, instance, validated_data):
         pass
 
     def create(self, validated_data):
-        user = Users.objects.get(pk=validated_data.get('user_id'))
-        post = Post.objects.create(user=user,
-                                   title=validated_data.get('title'),
-                                   content=validated_data.get('content'))
-        index = 1
+        user = self.context['request'].user
+        try:
+            return uploads.create_post(user, validated_data.get('title'), validated_data.get('content'),
+                                       validated_data['names'], token=validated_data.get('upload_token'))
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'upload_token': e.messages})
+        except Exception:
+            if validated_data.get('uploaded'):
+                uploads.discard(validated_data['names'])
+            raise
+
+
+class PostImageUploadSerializer(serializers.Serializer):
+    """两段式发帖的第一步：先上传图片，返回发帖时使用的 upload_token"""
+    images = serializers.ListField(child=serializers.FileField(allow_empty_file=False),
+                                   allow_empty=False,
+                                   max_length=uploads.MAX_IMAGES,
+                                   write_only=True)
+    upload_token = serializers.CharField(read_only=True)
+
+    def validate_images(self, value):
+        try:
+            return uploads.save_uploads(value)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
 
-        for image in validated_data.get('images'):
-            print(index)
-            PostImages.objects.create(post=post,
-                                      order_number=index,
-                                      image=image)
-            index += 1
-        return post
+    def create(self, validated_data):
+        return {'upload_token': uploads.issue_token(self.context['request'].user.id, validated_data['images'])}
 
 
 class PostLikeCreateSerializer(serializers.Serializer):
-    post_id = serializers.IntegerField(write_only=True)
-    user_id = serializers.IntegerField(write_only=True)
-    id = serializers.IntegerField(read_only=True)
-    timestamp = serializers.DateTimeField(read_only=True)
-
-    def create(self, validated_data):
-        post = Post.objects.get(id=validated_data.get("post_id"))
+    """点赞与取消点赞：action 为 like / unlike 时可以安全重试，toggle 根据当前状态切换"""
+    post_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['toggle', 'like', 'unlike'], default='toggle', write_only=True)
+    liked = serializers.BooleanField(read_only=True)
 
-        user = Users.objects.get(id=validated_data.get('user_id'))
-        if post is None:
+    def validate_post_id(self, value):
+        if not Post.objects.filter(pk=value).exists():
             raise serializers.ValidationError("帖子不存在")
-        if user is None:
-            raise serializers.ValidationError("用户不存在")
-        instance = PostLike.objects.create(post=post,
-                                           user=user)
-        return instance
+        return value
+
+    def create(self, validated_data):
+        post_id, user_id = validated_data['post_id'], self.context['request'].user.id
+        action = validated_data['action']
+        if action == 'toggle':
+            action = 'unlike' if post_id in likes.liked_post_ids(user_id) else 'like'
+        if action == 'like':
+            created = likes.like(user_id, post_id)
+        else:
+            created = False
+            likes.unlike(user_id, post_id)
+        return {'post_id': post_id, 'liked': action == 'like', 'created': created}
 
     def update(self, instance, validated_data):
         pass
@@ -498,16 +743,30 @@ class CommunitySubscribeListSerializer(serializers.ModelSerializer):
         model = Users
         fields = ['id', 'subscribe_posts']
 
+    # 视图分页后通过 context 传入当前页的帖子
     def get_subscribe_posts(self, obj):
-        subscribe = Fans.objects.filter(fan=obj.id)
-        all_posts = Post.objects.none()
-        for each in subscribe:
-            posts = Post.objects.filter(user=each.user)
-            all_posts = posts | all_posts
-        ser_all_posts = PostListSerializer(instance=all_posts, many=True)
+        posts = self.context.get('posts')
+        if posts is None:
+            posts = Post.objects.filter(timeline_entries__owner=obj.id, is_active=True) \
+                .select_related('user').with_surface().order_by('-timestamp')
+        ser_all_posts = PostListSerializer(instance=posts, many=True, context=self.context)
         return ser_all_posts.data
 
 
+class CategoryProduceIndexSerializer(serializers.ModelSerializer):
+    """商品分类索引序列化器，输出格式与商城首页商品一致"""
+    id = serializers.IntegerField(source='base_produce_id')
+    price = serializers.FloatField(source='min_price')
+    surface = serializers.SerializerMethodField('get_surface')
+
+    class Meta:
+        model = CategoryProduceIndex
+        fields = ['id', 'name', 'price', 'surface']
+
+    def get_surface(self, obj):
+        return media_url(obj.surface)
+
+
 class CategoryProduceListSerializer(serializers.ModelSerializer):
     """商品固定分类序列化器"""
     produces = serializers.SerializerMethodField("get_category_produces")
@@ -516,7 +775,10 @@ class CategoryProduceListSerializer(serializers.ModelSerializer):
         model = Category
         fields = ['name', 'produces']
 
+    # 视图分页后通过 context 传入当前页的索引行
     def get_category_produces(self, obj):
-        produces = BaseProduce.objects.filter(category=obj.name, is_active=True)
-        ser_produces = MallBaseProduceListSerializer(instance=produces, many=True)
+        produces = self.context.get('produces')
+        if produces is None:
+            produces = obj.produce_index.all()
+        ser_produces = CategoryProduceIndexSerializer(instance=produces, many=True)
         return ser_produces.data
@@ -0,0 +1,213 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from android.database import NATIVE_HEALTH_CHECKS, close_broken_connections
+
+from . import addresses, authentication, caching, counters, derivatives, events, likes, search, timeline
+from .models import Address, BaseProduce, CategoryProduceIndex, Fans, Order, Post, PostComments, PostLike, Produce, \
+    ProduceComment, ProduceImages, ProduceRating, Users
+
+
+# 商品分类索引维护：商品、子商品价格、展示图片变化时刷新对应索引行
+@receiver(post_save, sender=BaseProduce)
+@receiver(post_delete, sender=BaseProduce)
+def refresh_base_produce_index(sender, instance, **kwargs):
+    CategoryProduceIndex.refresh(instance.pk)
+
+
+@receiver(post_save, sender=Produce)
+@receiver(post_delete, sender=Produce)
+def refresh_produce_index(sender, instance, **kwargs):
+    CategoryProduceIndex.refresh(instance.parent_produce_id)
+
+
+@receiver(post_save, sender=ProduceImages)
+@receiver(post_delete, sender=ProduceImages)
+def refresh_produce_images_index(sender, instance, **kwargs):
+    CategoryProduceIndex.refresh(instance.produce_id)
+
+
+# 全文搜索索引：商品、子商品、帖子变化时重新索引对应文档
+@receiver(post_save, sender=BaseProduce)
+@receiver(post_delete, sender=BaseProduce)
+def refresh_base_produce_search(sender, instance, **kwargs):
+    search.refresh_produce(instance.pk)
+
+
+@receiver(post_save, sender=Produce)
+@receiver(post_delete, sender=Produce)
+def refresh_produce_search(sender, instance, **kwargs):
+    search.refresh_produce(instance.parent_produce_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def refresh_post_search(sender, instance, **kwargs):
+    search.refresh_post(instance.pk)
+
+
+# 商品评分汇总：新商品创建空的评分行，评论带来的增量见下方 COUNTERS
+@receiver(post_save, sender=BaseProduce)
+def create_produce_rating(sender, instance, created, **kwargs):
+    if created:
+        ProduceRating.objects.create(base_produce=instance)
+
+
+# 商品详情缓存失效：商品、子商品、图片、评论变化时更新版本号
+@receiver(post_save, sender=BaseProduce)
+@receiver(post_delete, sender=BaseProduce)
+def invalidate_base_produce_detail(sender, instance, **kwargs):
+    caching.invalidate('produce-detail', instance.pk)
+
+
+@receiver(post_save, sender=Produce)
+@receiver(post_delete, sender=Produce)
+def invalidate_produce_detail(sender, instance, **kwargs):
+    caching.invalidate('produce-detail', instance.parent_produce_id)
+
+
+@receiver(post_save, sender=ProduceImages)
+@receiver(post_delete, sender=ProduceImages)
+def invalidate_produce_images_detail(sender, instance, **kwargs):
+    caching.invalidate('produce-detail', instance.produce_id)
+
+
+@receiver(post_save, sender=ProduceComment)
+@receiver(post_delete, sender=ProduceComment)
+def invalidate_produce_comment_detail(sender, instance, **kwargs):
+    caching.invalidate('produce-detail', instance.base_produce_id)
+
+
+# 登录令牌缓存的用户对象失效
+@receiver(post_save, sender=Users)
+@receiver(post_delete, sender=Users)
+def forget_cached_user(sender, instance, **kwargs):
+    authentication.forget_user(instance.pk)
+
+
+# 默认地址缓存失效
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def forget_default_address(sender, instance, **kwargs):
+    addresses.forget_default(instance.user_id)
+
+
+# 点赞集合随点赞记录更新：likes.like 使用原生 SQL，在函数内单独处理
+@receiver(post_save, sender=PostLike)
+def add_liked_post(sender, instance, **kwargs):
+    likes.liked_changed(instance.user_id, instance.post_id, True)
+
+
+@receiver(post_delete, sender=PostLike)
+def remove_liked_post(sender, instance, **kwargs):
+    likes.liked_changed(instance.user_id, instance.post_id, False)
+
+
+# 实时事件：订单状态变化、帖子被点赞或评论时推送给相关用户；likes.like 使用原生 SQL，在函数内单独推送
+@receiver(post_init, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    # 延迟加载的字段不在 __dict__ 中，避免触发查询
+    instance._original_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Order)
+def publish_order_status(sender, instance, created, **kwargs):
+    if not created and instance._original_status is not None and instance.status != instance._original_status:
+        events.order_status_changed(instance)
+    instance._original_status = instance.status
+
+
+@receiver(post_save, sender=PostLike)
+def publish_post_liked(sender, instance, created, **kwargs):
+    if created:
+        events.post_liked(instance.post_id, instance.user_id)
+
+
+@receiver(post_save, sender=PostComments)
+def publish_post_commented(sender, instance, created, **kwargs):
+    if created:
+        post = PostComments.post.field
+        events.post_commented(instance, author_id=instance.post.user_id if post.is_cached(instance) else None)
+
+
+# 订阅时间线维护：发帖写扩散，关注/取关时回填或清理收件箱
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Fans)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.follow(instance.fan_id, instance.user_id)
+
+
+@receiver(post_delete, sender=Fans)
+def clean_timeline(sender, instance, **kwargs):
+    timeline.unfollow(instance.fan_id, instance.user_id)
+
+
+# 冗余计数维护：每个来源模型对应 (计数模型, 主键, 字段, 增量) 列表，新增时累加，删除时扣减
+COUNTERS = {
+    PostLike: lambda like: [(Post, like.post_id, 'like_num', 1)],
+    PostComments: lambda comment: [(Post, comment.post_id, 'comment_num', 1)],
+    Fans: lambda fans: [(Users, fans.user_id, 'fan_num', 1),
+                        (Users, fans.fan_id, 'subscribe_num', 1)],
+    Order: lambda order: [(BaseProduce, order.produce.parent_produce_id, 'sales_num', order.quantity)],
+    ProduceComment: lambda comment: [(BaseProduce, comment.base_produce_id, 'comment_num', 1),
+                                     (ProduceRating, comment.base_produce_id, 'total', 1),
+                                     (ProduceRating, comment.base_produce_id, 'star_sum', int(comment.star)),
+                                     (ProduceRating, comment.base_produce_id,
+                                      ProduceRating.star_field(comment.star), 1)],
+}
+
+
+def _apply_counters(sender, instance, sign):
+    grouped = defaultdict(dict)
+    for model, pk, field, delta in COUNTERS[sender](instance):
+        grouped[model, pk][field] = sign * delta
+    for (model, pk), deltas in grouped.items():
+        counters.incr_many(model, pk, deltas)
+
+
+def count_created(sender, instance, created, **kwargs):
+    if created:
+        _apply_counters(sender, instance, 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    _apply_counters(sender, instance, -1)
+
+
+for counted in COUNTERS:
+    post_save.connect(count_created, sender=counted, dispatch_uid='count_created_%s' % counted.__name__)
+    post_delete.connect(count_deleted, sender=counted, dispatch_uid='count_deleted_%s' % counted.__name__)
+
+
+# 上传图片派生图：原图新增或替换后异步生成缩略图
+for model in derivatives.DERIVATIVES:
+    post_init.connect(derivatives.remember_source, sender=model, dispatch_uid='remember_source_%s' % model.__name__)
+    pre_save.connect(derivatives.reset_derivatives, sender=model, dispatch_uid='reset_derivatives_%s' % model.__name__)
+    post_save.connect(derivatives.source_changed, sender=model, dispatch_uid='source_changed_%s' % model.__name__)
+
+
+# 持久连接健康检查：Django 3.2 不支持 CONN_HEALTH_CHECKS，每个请求开始时检查复用的连接
+if not NATIVE_HEALTH_CHECKS:
+    request_started.connect(close_broken_connections, dispatch_uid='close_broken_connections')
+
+
+# 本地 SQLite 调优：WAL 模式下读写互不阻塞，synchronous=NORMAL 在 WAL 下不会损坏数据库
+@receiver(connection_created, dispatch_uid='tune_sqlite')
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=%d' % (getattr(settings, 'SQLITE_BUSY_TIMEOUT', 5) * 1000))
@@ -1,32 +1,54 @@
 import time
 
-import requests
 from asgiref.sync import async_to_sync
 from celery import shared_task
 from channels.layers import get_channel_layer
-from django.core.cache import cache
+from django.apps import apps
+
+from . import carts, counters, derivatives, probes, ranking, uploads
+
+
+def reply(group, message):
+    """将结果发给聊天连接所在的组"""
+    async_to_sync(get_channel_layer().group_send)(group, {"type": "chat.message", "message": message})
+
+
+@shared_task
+def add(group, x, y):
+    try:
+        message = '{}+{}={}'.format(x, y, int(x) + int(y))
+    except ValueError:
+        message = 'Arguments of `sum` must be integers.'
+    reply(group, message)
+
+
+@shared_task
+def url_status(group, *urls):
+    """并发检查一个或多个地址，全部完成后一次回复"""
+    results = probes.probe(urls)
+    reply(group, '\n'.join(f'{url} status is {status}' for url, status in results.items()))
+
+
+@shared_task
+def flush_counters():
+    return counters.flush()
+
+
+@shared_task
+def flush_carts():
+    return carts.flush()
+
+
+@shared_task
+def rebuild_recommend_feed():
+    return ranking.rebuild()
 
-channel_layer = get_channel_layer()
 
 @shared_task
-def add(channel_name, x, y):
-    message = '{}+{}={}'.format(x, y, int(x) + int(y))
-    async_to_sync(channel_layer.send)(channel_name, {"type": "chat.message", "message": message})
+def discard_expired_uploads():
+    return uploads.discard_expired()
 
 
 @shared_task
-def url_status(channel_name, url):
-    if not url.startswith('http'):
-        url = f'https://{url}'
-
-    status = cache.get(url)
-    if not status:
-        try:
-            r = requests.get(url, timeout=10)
-            status = r.status_code
-            cache.set(url, status, 60*60)
-        except requests.exceptions.RequestException:
-            status = 'Not available'
-
-    message = f'{url} status is {status}'
-    async_to_sync(channel_layer.send)(channel_name, {"type": "chat.message", "message": message})
+def generate_derivatives(label, pk):
+    return derivatives.generate(apps.get_model(label), pk)
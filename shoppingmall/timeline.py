@@ -0,0 +1,102 @@
+"""
+订阅时间线：普通用户发帖时写入粉丝的收件箱（fan-out on write），
+粉丝数超过 TIMELINE_FANOUT_LIMIT 的用户不写扩散，由粉丝读取时按需拉取（fan-out on read）。
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Q, Subquery
+
+from .models import Fans, Post, TimelineEntry
+from .routers import read_from_primary
+
+FANOUT_LIMIT = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 1000)
+BACKFILL_SIZE = getattr(settings, 'TIMELINE_BACKFILL_SIZE', 50)
+BATCH_SIZE = 500
+# 拉取时从拉取位置往前多读的时间，补上发布时间早于拉取位置、但在上次拉取之后才提交的帖子
+PULL_OVERLAP = timedelta(seconds=60)
+
+
+def _pulled_key(owner_id):
+    return 'timeline:pulled:%s' % owner_id
+
+
+def is_heavy(user_id):
+    """粉丝数是否超过写扩散上限"""
+    return Fans.objects.filter(user=user_id).count() > FANOUT_LIMIT
+
+
+def fan_out_post(post):
+    """将新帖子写入作者所有粉丝的收件箱，大V帖子跳过"""
+    fans = Fans.objects.filter(user=post.user_id).values_list('fan_id', flat=True)
+    if fans.count() > FANOUT_LIMIT:
+        return 0
+    entries = [TimelineEntry(owner_id=fan_id, post_id=post.id, timestamp=post.timestamp) for fan_id in fans]
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(entries)
+
+
+def follow(owner_id, followee_id):
+    """关注后回填被关注者最近的帖子"""
+    if is_heavy(followee_id):
+        # 大V帖子由读取时拉取，清除拉取位置以便下次读取时补齐
+        cache.delete(_pulled_key(owner_id))
+        return
+    posts = Post.objects.filter(user=followee_id).order_by('-timestamp').values_list('id', 'timestamp')
+    entries = [TimelineEntry(owner_id=owner_id, post_id=post_id, timestamp=timestamp)
+               for post_id, timestamp in posts[:BACKFILL_SIZE]]
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def unfollow(owner_id, followee_id):
+    TimelineEntry.objects.filter(owner=owner_id, post__user=followee_id).delete()
+
+
+def pull_heavy_followees(owner_id):
+    """读取时拉取所关注大V自上次拉取以来的新帖子写入收件箱
+
+    拉取位置记为已拉取帖子中最新的发布时间，而不是读取时刻，避免跳过读取时尚未提交的帖子；
+    首次拉取只回填最近 BACKFILL_SIZE 条，之后按 (timestamp, id) 升序分页直到追上最新帖子。
+    拉取结果决定之后的拉取位置，从主库读取，避免副本延迟漏掉帖子。
+
+    该函数在 GET 请求中执行，写入是幂等的：收件箱按 (owner, post) 唯一，重复拉取由 ignore_conflicts 忽略；
+    并发请求可能让拉取位置回退到较早的帖子，只会让下次多读一段，不会丢帖子或产生重复条目。
+    """
+    followers = Fans.objects.filter(user=OuterRef('user')).values('user').annotate(c=Count('*')).values('c')
+    heavy = Fans.objects.filter(fan=owner_id).annotate(followers=Subquery(followers)) \
+        .filter(followers__gt=FANOUT_LIMIT).values('user')
+
+    with read_from_primary():
+        posts = Post.objects.filter(user__in=heavy).values_list('id', 'timestamp')
+        pulled = cache.get(_pulled_key(owner_id))
+        if pulled is None:
+            latest = list(posts.order_by('-timestamp', '-id')[:BACKFILL_SIZE])
+            _save_entries(owner_id, latest)
+            if latest:
+                cache.set(_pulled_key(owner_id), latest[0][1], None)
+            return
+
+        page = posts.filter(timestamp__gte=pulled - PULL_OVERLAP).order_by('timestamp', 'id')
+        while True:
+            batch = list(page[:BATCH_SIZE])
+            _save_entries(owner_id, batch)
+            if batch:
+                last_id, last_timestamp = batch[-1]
+                pulled = max(pulled, last_timestamp)
+            if len(batch) < BATCH_SIZE:
+                break
+            page = posts.filter(Q(timestamp__gt=last_timestamp) | Q(timestamp=last_timestamp, id__gt=last_id)) \
+                .order_by('timestamp', 'id')
+        cache.set(_pulled_key(owner_id), pulled, None)
+
+
+def _save_entries(owner_id, posts):
+    entries = [TimelineEntry(owner_id=owner_id, post_id=post_id, timestamp=timestamp) for post_id, timestamp in posts]
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def timeline_queryset(owner_id):
+    """用户订阅时间线，调用方负责分页"""
+    pull_heavy_followees(owner_id)
+    return TimelineEntry.objects.filter(owner=owner_id, post__is_active=True)
@@ -0,0 +1,127 @@
+"""
+帖子图片上传：上传文件由 TemporaryFileUploadHandler 直接写入磁盘临时文件，
+在线程池中校验并完整解码后移动到存储，帖子图片在一个事务中 bulk_create。
+也可以先上传图片换取签名 token，发帖时凭 token 关联，发帖请求不再携带图片。
+token 对应的图片记录在 StagedUpload 中，发帖时在创建帖子的事务里删除，发帖失败时 token 仍然可用；
+超过 TOKEN_MAX_AGE 仍未使用的图片由定时任务 discard_expired_uploads 删除。
+"""
+from datetime import timedelta
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import derivatives
+from .models import Post, PostImages, StagedUpload
+
+MAX_IMAGES = 6
+TOKEN_SALT = 'shoppingmall.uploads'
+TOKEN_MAX_AGE = getattr(settings, 'POST_UPLOAD_TOKEN_MAX_AGE', 60 * 60)
+
+# Pillow 解码时会释放 GIL，线程池即可并行处理多张图片
+_pool = ThreadPoolExecutor(max_workers=getattr(settings, 'POST_UPLOAD_WORKERS', 4),
+                           thread_name_prefix='post-upload')
+
+
+def verify_image(upload):
+    """先 verify 检查文件结构，再重新打开完整解码一次，截断或损坏的图片在这里被拒绝"""
+    source = upload.temporary_file_path() if hasattr(upload, 'temporary_file_path') else upload
+    try:
+        with Image.open(source) as image:
+            image.verify()
+        if source is upload:
+            upload.seek(0)
+        with Image.open(source) as image:
+            image.load()
+    except Exception:
+        raise ValidationError('%s 不是有效的图片' % upload.name)
+    finally:
+        if source is upload:
+            upload.seek(0)
+
+
+def store(upload):
+    """保存到 post_imgs，临时文件在本地存储上是直接移动而不是复制"""
+    name = PostImages._meta.get_field('image').generate_filename(None, upload.name)
+    return default_storage.save(name, upload)
+
+
+def _process(upload):
+    verify_image(upload)
+    return store(upload)
+
+
+def discard(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def save_uploads(uploads):
+    """并发校验并保存全部图片，按上传顺序返回存储路径；有图片无效时删除已保存的文件并抛出 ValidationError"""
+    futures = [_pool.submit(_process, upload) for upload in uploads]
+    names, errors = [], []
+    for future in futures:
+        try:
+            names.append(future.result())
+        except ValidationError as e:
+            errors.extend(e.messages)
+    if errors:
+        discard(names)
+        raise ValidationError(errors)
+    return names
+
+
+def _token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_token(user_id, names):
+    """签发 upload_token 并记录待发帖的图片"""
+    token = signing.dumps({'user': user_id, 'images': names}, salt=TOKEN_SALT, compress=True)
+    digest = _token_digest(token)
+    StagedUpload.objects.bulk_create([StagedUpload(token=digest, image=name) for name in names])
+    return token
+
+
+def redeem_token(token, user_id):
+    """校验 token 属于该用户、未过期且未使用，返回图片路径；发帖成功后 token 才失效，见 create_post"""
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        raise ValidationError('上传凭证无效或已过期')
+    if data['user'] != user_id:
+        raise ValidationError('上传凭证无效或已过期')
+    if not StagedUpload.objects.filter(token=_token_digest(token)).exists():
+        raise ValidationError('上传凭证已被使用')
+    return data['images']
+
+
+def create_post(user, title, content, names, token=None):
+    """在一个事务中创建帖子与全部图片记录；传入 token 时同一事务中删除待发帖记录，每个 token 只能成功发帖一次"""
+    with transaction.atomic():
+        # 并发使用同一 token 时只有一个事务能删除到记录
+        if token is not None and not StagedUpload.objects.filter(token=_token_digest(token)).delete()[0]:
+            raise ValidationError('上传凭证已被使用')
+        post = Post.objects.create(user=user, title=title, content=content)
+        PostImages.objects.bulk_create([PostImages(post=post, order_number=index, image=name)
+                                        for index, name in enumerate(names, 1)])
+        # bulk_create 不触发 signals，派生图需要单独调度
+        for pk in post.images.values_list('pk', flat=True):
+            derivatives.schedule(PostImages, pk)
+    return post
+
+
+def discard_expired():
+    """删除超过 TOKEN_MAX_AGE 仍未发帖的图片，返回删除的文件数"""
+    expired = StagedUpload.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=TOKEN_MAX_AGE))
+    rows = list(expired.values_list('id', 'image'))
+    discard([name for _, name in rows])
+    StagedUpload.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+    return len(rows)
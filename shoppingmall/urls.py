@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 from rest_framework.routers import DefaultRouter
 
 # 定义视图处理的路由器
@@ -16,20 +16,33 @@ router.register(r'users/likeposts', views.UserLikePostsListViewSet)
 router.register(r'posts', views.PostDetailViewSet)
 router.register(r'users/carts', views.UserCartViewSet)
 router.register(r'users/address', views.UserDefaultAddressViewSet)
+router.register(r'addresses', views.AddressViewSet)
 
 urlpatterns = [
     # re_path(r'^users/(?P<uid>\d+)$', views.UsersViewSet.as_view(actions=)),  # 用户详情视图
     # path('me/login/', views.login, name='login'),
     path(r'malls/', views.MallProduceListView.as_view(), name="malls"),
     path(r'community/recommend/', views.CommunityListView.as_view(), name="community/recommend"),
-    url(r'^ws/chat/$', consumers.ChatConsumer),
 
     path(r'community/posts/comments/', views.PostCommentsCreateView.as_view(), name="user-comment-post"),
     path(r'community/posts/like', views.PostLikeCreateView.as_view(), name='like-post'),
     path(r'login/', views.LoginOrRegisterView.as_view(), name='login'),
     path(r'register/', views.LoginOrRegisterView.as_view(), name='register'),
+    path(r'logout/', views.LogoutView.as_view(), name='logout'),
     path(r'malls/produces/comments/', views.ProduceCommentsCreateView.as_view(), name="user-comment-produce"),
-    # path(r'community/posts/', views.PostCreateView.as_view(), name="create_post", namespace='swagger_ignore')
+    path(r'community/posts/', views.PostCreateView.as_view(), name="create-post"),
+    path(r'community/uploads/', views.PostImageUploadView.as_view(), name="upload-post-images"),
+    path(r'search/produces/', views.SearchProduceView.as_view(), name='search-produces'),
+    path(r'search/posts/', views.SearchPostView.as_view(), name='search-posts'),
+    path(r'search/suggest/', views.SearchSuggestView.as_view(), name='search-suggest'),
+    path(r'carts/', views.CartView.as_view(), name='cart'),
+    path(r'carts/items/<int:produce_id>/', views.CartItemView.as_view(), name='cart-item'),
+
+    # 异步版本的热点读接口，需要通过 ASGI 服务访问
+    path(r'async/malls/', async_views.mall_produce_list, name='async-malls'),
+    path(r'async/community/recommend/', async_views.community_recommend, name='async-community-recommend'),
+    path(r'async/malls/produces/<int:pk>/', async_views.produce_detail, name='async-produce-detail'),
+    path(r'async/community/posts/<int:pk>/', async_views.post_detail, name='async-post-detail'),
 
 ]
 urlpatterns += router.urls
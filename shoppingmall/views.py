@@ -1,46 +1,167 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db.models import Prefetch
 from rest_framework import viewsets, status, mixins
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.mixins import CreateModelMixin
 from rest_framework.parsers import FileUploadParser, MultiPartParser
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.generics import ListAPIView, RetrieveUpdateDestroyAPIView, CreateAPIView, RetrieveAPIView, \
-    UpdateAPIView
-from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet
     GenericAPIView, DestroyAPIView, UpdateAPIView
-from rest_framework.viewsets import ReadOnlyModelViewSet
+from rest_framework.views import APIView
+from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet
 
+from . import addresses, authentication, caching, carts, likes, ranking, search, timeline
+from .routers import read_from_replica
+from .pagination import CategoryProduceCursorPagination, TimestampCursorPagination, OrderCursorPagination, \
+    ProduceCommentCursorPagination
 from .serializers import *
 from .models import *
 
 
-class UsersViewSet(RetrieveUpdateDestroyAPIView,
+class ReadReplicaMixin:
+    """GET 等只读请求的查询发往只读副本，写请求仍使用主库"""
+    replica_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in self.replica_methods:
+            return super().dispatch(request, *args, **kwargs)
+        with read_from_replica():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class PaginatedRelationMixin:
+    """详情视图中的子列表分页：当前页通过 serializer context 传入，响应附带 next/previous 游标"""
+    page_context_key = None
+
+    def get_relation_queryset(self, instance):
+        raise NotImplementedError
+
+    def get_relation_page(self, page):
+        return page
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        page = self.paginate_queryset(self.get_relation_queryset(instance))
+        context = self.get_serializer_context()
+        context[self.page_context_key] = self.get_relation_page(page)
+        serializer = self.get_serializer(instance, context=context)
+        return Response(data=dict(serializer.data,
+                                  next=self.paginator.get_next_link(),
+                                  previous=self.paginator.get_previous_link()))
+
+
+class OwnUserMixin:
+    """用户 id 出现在 URL 中的私有数据：需要登录，只能访问自己，其他用户的 id 返回 404"""
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return super().get_queryset().filter(pk=self.request.user.id)
+
+
+class UsersViewSet(ReadReplicaMixin,
+                   RetrieveUpdateDestroyAPIView,
                    viewsets.GenericViewSet, ):
     queryset = Users.objects.all()
     serializer_class = UserDetailSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
 
+    # 任何人都可以查看用户主页，只能修改或注销自己的账号
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return self.queryset
+        return self.queryset.filter(pk=self.request.user.id)
 
-class UserOrdersListViewSet(viewsets.GenericViewSet,
+
+class UserOrdersListViewSet(ReadReplicaMixin,
+                            OwnUserMixin,
+                            PaginatedRelationMixin,
+                            viewsets.GenericViewSet,
                             RetrieveAPIView):
     serializer_class = UsersOrderListSerializer
     queryset = Users.objects.all()
+    pagination_class = OrderCursorPagination
+    page_context_key = 'orders'
+
+    def get_relation_queryset(self, instance):
+        return instance.orders.prefetch_related(Prefetch('produce', queryset=Produce.objects.with_surface()))
 
 
-class UserMyPostsListViewSet(viewsets.GenericViewSet,
+class UserMyPostsListViewSet(ReadReplicaMixin,
+                             PaginatedRelationMixin,
+                             viewsets.GenericViewSet,
                              RetrieveAPIView):
     serializer_class = UsersMyPostListSeriazlizer
     queryset = Users.objects.all()
+    pagination_class = TimestampCursorPagination
+    page_context_key = 'posts'
 
+    def get_relation_queryset(self, instance):
+        return instance.posts.select_related('user').with_surface()
 
-class UserLikePostsListViewSet(viewsets.GenericViewSet,
+
+class UserLikePostsListViewSet(ReadReplicaMixin,
+                               PaginatedRelationMixin,
+                               viewsets.GenericViewSet,
                                RetrieveAPIView):
     serializer_class = UserLikePostsListSeriazlizer
     queryset = Users.objects.all()
+    pagination_class = TimestampCursorPagination
+    page_context_key = 'love'
+
+    def get_relation_queryset(self, instance):
+        return instance.love.prefetch_related(
+            Prefetch('post', queryset=Post.objects.select_related('user').with_surface()))
 
 
-class UserCartViewSet(viewsets.GenericViewSet,
+class UserCartViewSet(ReadReplicaMixin,
+                      OwnUserMixin,
+                      viewsets.GenericViewSet,
                       RetrieveAPIView):
     queryset = Users.objects.all()
     serializer_class = UserShoppingCartSerizalizer
 
+    # 购物车从 carts 中读取，条目数有上限，不再分页；保留 next/previous 字段兼容旧客户端
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        context = dict(self.get_serializer_context(), items=carts.items(instance.id))
+        serializer = self.get_serializer(instance, context=context)
+        return Response(data=dict(serializer.data, next=None, previous=None))
+
+
+class CartView(GenericAPIView):
+    """当前用户的购物车：GET 查看，POST 加入（累加数量）"""
+    serializer_class = CartAddSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        items = carts.items(request.user.id)
+        return Response({'items': CartItemSerializer(items, many=True).data})
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class CartItemView(GenericAPIView):
+    """PATCH 修改购物车中某个子商品的数量（0 表示移除），DELETE 移除"""
+    serializer_class = CartQuantitySerializer
+    permission_classes = [IsAuthenticated]
+
+    def patch(self, request, produce_id, *args, **kwargs):
+        serializer = self.get_serializer(produce_id, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    def delete(self, request, produce_id, *args, **kwargs):
+        update_cart(request.user.id, [(produce_id, 0)], merge=False)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class LoginOrRegisterView(CreateAPIView):
     serializer_class = LoginOrRegisterSerizalizer
@@ -55,46 +176,167 @@ class LoginOrRegisterView(CreateAPIView):
             return Response(data=serializers.data, status=status.HTTP_200_OK)
 
 
-class MallProduceListView(ListAPIView):
+class LogoutView(APIView):
+    """使当前请求携带的登录令牌失效"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        authentication.revoke_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MallProduceListView(ReadReplicaMixin, ListAPIView):
     serializer_class = MallBaseProduceListSerializer
-    queryset = BaseProduce.objects.filter(is_active=True)
+    queryset = BaseProduce.objects.filter(is_active=True).with_listing().order_by('id')
+
+
+class SearchProduceView(ReadReplicaMixin, ListAPIView):
+    """商品搜索，q 匹配商品名与子商品名，按相关度排序"""
+    serializer_class = MallBaseProduceListSerializer
+    queryset = MallProduceListView.queryset
+
+    def get_queryset(self):
+        return search.search(search.PRODUCE, self.request.query_params.get('q', ''), super().get_queryset())
+
+
+class SearchSuggestView(ReadReplicaMixin, APIView):
+    """输入联想，q 的最后一个词按前缀匹配，type 可选 produce（默认）、post"""
 
+    def get(self, request, *args, **kwargs):
+        kind = search.POST if request.query_params.get('type') == search.POST else search.PRODUCE
+        return Response(search.suggest(kind, request.query_params.get('q', '')))
 
-class MallCategoryProduceListViewSet(viewsets.GenericViewSet,
+
+class MallCategoryProduceListViewSet(ReadReplicaMixin,
+                                     PaginatedRelationMixin,
+                                     viewsets.GenericViewSet,
                                      RetrieveAPIView,):
     serializer_class = CategoryProduceListSerializer
     queryset = Category.objects.all()
+    pagination_class = CategoryProduceCursorPagination
+    page_context_key = 'produces'
+
+    def get_relation_queryset(self, instance):
+        return instance.produce_index.all()
 
 
-class BaseProduceDetailViewSet(viewsets.GenericViewSet,
+class BaseProduceDetailViewSet(ReadReplicaMixin,
+                               viewsets.GenericViewSet,
                                RetrieveAPIView):
     serializer_class = BaseProduceDetailSerializer
-    queryset = BaseProduce.objects.all()
+    queryset = BaseProduce.objects.select_related('rating').prefetch_related('images', 'sub_produce')
+    # 路由只匹配数字 id，非数字 id 直接 404，不会传到 comments 的查询里
+    lookup_value_regex = r'\d+'
+
+    # 商品详情读穿缓存，由 signals 在商品相关数据变化时失效
+    def retrieve(self, request, *args, **kwargs):
+        data = caching.read_through('produce-detail', kwargs['pk'],
+                                    lambda: self.get_serializer(self.get_object()).data,
+                                    timeout=settings.PRODUCE_DETAIL_CACHE_TIMEOUT)
+        return Response(data)
+
+    # 商品评论分页列表：malls/produces/<id>/comments/?sort=time|star|likes
+    @action(detail=True, methods=['get'], pagination_class=ProduceCommentCursorPagination,
+            serializer_class=ProduceCommentSerializer)
+    def comments(self, request, pk=None):
+        comments = ProduceComment.objects.filter(base_produce=pk).select_related('order__user')
+        page = self.paginate_queryset(comments)
+        # 只在没有评论时确认商品存在，有评论的页面不多一次查询
+        if not page and not self.get_queryset().filter(pk=pk).exists():
+            raise NotFound()
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class CommunityListView(ReadReplicaMixin, ListAPIView):
+    serializer_class = PostListSerializer
+    queryset = Post.objects.filter(is_active=True).select_related('user').with_surface().order_by('-timestamp')
 
+    # 按预先计算的热度排名分页，排名尚未生成时按时间倒序
+    def get_queryset(self):
+        return ranking.ranked_feed(super().get_queryset())
 
-class CommunityListView(ListAPIView):
-    serializer_class = PostListSerializer
-    queryset = Post.objects.filter(is_active=True)
+    # 登录用户标记点赞状态
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.user.is_authenticated:
+            context['liked_post_ids'] = likes.liked_post_ids(self.request.user.id)
+        return context
 
 
-class CommunitySubscribeListViewSet(viewsets.GenericViewSet,
+class SearchPostView(CommunityListView):
+    """帖子搜索，q 匹配标题与正文，按相关度排序"""
+
+    def get_queryset(self):
+        return search.search(search.POST, self.request.query_params.get('q', ''), self.queryset.all())
+
+
+class CommunitySubscribeListViewSet(ReadReplicaMixin,
+                                    PaginatedRelationMixin,
+                                    viewsets.GenericViewSet,
                                     RetrieveAPIView):
     parser_classes = [MultiPartParser, ]
     serializer_class = CommunitySubscribeListSerializer
     queryset = Users.objects.all()
+    pagination_class = TimestampCursorPagination
+    page_context_key = 'posts'
+
+    # 读取前会把所关注大V的新帖子补进收件箱，写入是幂等的，见 timeline.pull_heavy_followees
+    def get_relation_queryset(self, instance):
+        return timeline.timeline_queryset(instance.id).prefetch_related(
+            Prefetch('post', queryset=Post.objects.select_related('user').with_surface()))
+
+    def get_relation_page(self, page):
+        return [entry.post for entry in page]
+
+    # 点赞状态属于发起请求的登录用户，而不是 URL 中时间线的主人
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.user.is_authenticated:
+            context['liked_post_ids'] = likes.liked_post_ids(self.request.user.id)
+        return context
 
 
-class PostViewSet(viewsets.GenericViewSet,
+class OwnPostMixin:
+    """任何人都可以查看帖子，修改或删除需要登录且只能操作自己的帖子，其他用户的帖子返回 404"""
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            return queryset
+        return queryset.filter(user=self.request.user.id)
+
+
+class PostViewSet(ReadReplicaMixin,
+                  OwnPostMixin,
+                  viewsets.GenericViewSet,
                   RetrieveAPIView, DestroyAPIView):
-    queryset = Post.objects.filter(is_active=True)
+    queryset = Post.objects.filter(is_active=True).with_detail()
     serializer_class = PostDetailSerializer
 
 
-class PostCreateView(CreateAPIView):
+class TemporaryFileUploadMixin:
+    """上传文件全部流式写入磁盘临时文件，不在内存中缓存"""
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+
+class PostCreateView(TemporaryFileUploadMixin, CreateAPIView):
 
     parser_classes = (MultiPartParser, )
     serializer_class = PostCreateSerializer
     queryset = Post.objects.all()
+    permission_classes = [IsAuthenticated]
+
+
+class PostImageUploadView(TemporaryFileUploadMixin, CreateAPIView):
+
+    parser_classes = (MultiPartParser, )
+    serializer_class = PostImageUploadSerializer
+    permission_classes = [IsAuthenticated]
 
 
 class OrderDetailViewSet(viewsets.GenericViewSet,
@@ -103,37 +345,81 @@ class OrderDetailViewSet(viewsets.GenericViewSet,
                          UpdateAPIView):
     serializer_class = OrderDetailSerializer
     queryset = Order.objects.all()
+    permission_classes = [IsAuthenticated]
+
+    # 只能查看和修改自己的订单
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user.id)
+
+    @action(detail=False, methods=['post'], serializer_class=CheckoutSerializer)
+    def checkout(self, request):
+        """把购物车中的条目一次性下单"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class UserDefaultAddressViewSet(viewsets.GenericViewSet,
+class UserDefaultAddressViewSet(ReadReplicaMixin,
+                                OwnUserMixin,
+                                viewsets.GenericViewSet,
                                 RetrieveAPIView,):
     serializer_class = UserDefaultAddressSerializer
     queryset = Users.objects.all()
 
 
+class AddressViewSet(ModelViewSet):
+    """当前用户的收货地址，POST addresses/<id>/default/ 设为默认地址"""
+    serializer_class = AddressSerializer
+    queryset = Address.objects.all()
+    permission_classes = [IsAuthenticated]
+    # 地址数量很少，一次返回全部，默认地址排在最前
+    pagination_class = None
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user.id).order_by('-is_default', 'id')
+
+    @action(detail=True, methods=['post'])
+    def default(self, request, pk=None):
+        address = save_address(self.get_object(), make_default=True)
+        return Response(self.get_serializer(address).data)
+
+
 class ProduceCommentsCreateView(CreateAPIView):
     serializer_class = CommentCreateSerializer
     queryset = ProduceComment.objects.all()
+    permission_classes = [IsAuthenticated]
 
 
 class PostCommentsCreateView(CreateAPIView):
     serializer_class = PostCommentSerializer
     queryset = PostComments.objects.all()
+    permission_classes = [IsAuthenticated]
 
 
 class PostLikeCreateView(CreateAPIView):
     serializer_class = PostLikeCreateSerializer
     queryset = PostLike.objects.all()
+    permission_classes = [IsAuthenticated]
 
+    def create(self, request, *args, **kwargs):
+        # 新增点赞记录时返回 201，重复点赞或取消点赞返回 200
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        created = serializer.instance['created']
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
-class PostDetailViewSet(ModelViewSet):
+
+class PostDetailViewSet(ReadReplicaMixin, OwnPostMixin, ModelViewSet):
     serializer_class = PostDetailSerializer
-    queryset = Post.objects.all()
+    # 列表与详情都一次预取作者、图片和评论，查询数与页大小无关
+    queryset = Post.objects.with_detail()
 
     def get_queryset(self):
         post_id = self.request.query_params.get('id', None)
-        queryset = Post.objects.all()
+        queryset = super().get_queryset()
         if post_id is not None:
             return queryset.filter(id=post_id)
         else: